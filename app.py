@@ -1,7 +1,9 @@
 import streamlit as st
 import pandas as pd
 import os
+from concurrent.futures import ThreadPoolExecutor
 from src.SecondModule.module2 import SimilarQuestionGenerator
+from src.question_bank import QuestionBank, load_question_bank
 import logging
 from typing import Optional, Tuple
 logging.basicConfig(level=logging.DEBUG)
@@ -26,13 +28,17 @@ logger = logging.getLogger(__name__)
 # 세션 상태 초기화 - 가장 먼저 실행되도록 최상단에 배치
 if 'initialized' not in st.session_state:
     st.session_state.initialized = True
+    # 세션에는 문제 은행의 행 번호와 선택한 보기만 저장 (문제 내용은 공유 QuestionBank에서 조회)
     st.session_state.wrong_questions = []
-    st.session_state.misconceptions = []
+    st.session_state.wrong_answers = []
     st.session_state.current_question_index = 0
     st.session_state.generated_questions = []
+    st.session_state.similar_question_cache = {}
+    st.session_state.similar_question_futures = {}
+    st.session_state.similar_question_refresh = set()
     st.session_state.current_step = 'initial'
     st.session_state.selected_wrong_answer = None
-    st.session_state.questions = []
+    st.session_state.question_indices = []
     logger.info("Session state initialized")
 
 # 문제 생성기 초기화
@@ -44,14 +50,24 @@ def load_question_generator():
         raise FileNotFoundError(f"CSV 파일이 존재하지 않습니다: {misconception_csv_path}")
     return SimilarQuestionGenerator(misconception_csv_path=misconception_csv_path)
 
-# CSV 데이터 로드 함수
-@st.cache_data
-def load_data(data_file = '/train.csv'):
+# 유사 문제 미리 생성(prefetch)용 executor - 모든 세션이 공유
+@st.cache_resource
+def get_prefetch_executor():
+    """백그라운드 유사 문제 생성 스레드 풀"""
+    return ThreadPoolExecutor(
+        max_workers=int(os.getenv("PREFETCH_WORKERS", "4")),
+        thread_name_prefix="similar-prefetch"
+    )
+
+# 문제 은행 로드 함수 - 모든 세션이 같은 객체를 공유 (cache_data처럼 호출마다 복사하지 않음)
+@st.cache_resource
+def load_data(data_file = '/train.csv') -> Optional[QuestionBank]:
     try:
         file_path = os.path.join(data_path, data_file.lstrip('/'))
-        df = pd.read_csv(file_path)
+        # 최초 1회만 CSV를 파싱하고 이후에는 Data/.cache의 columnar 캐시를 사용
+        bank = QuestionBank(load_question_bank(file_path))
         logger.info(f"Data loaded successfully from {file_path}")
-        return df
+        return bank
     except FileNotFoundError:
         st.error(f"파일을 찾을 수 없습니다: {data_file}")
         logger.error(f"File not found: {data_file}")
@@ -59,22 +75,26 @@ def load_data(data_file = '/train.csv'):
 
 def start_quiz():
     """퀴즈 시작 및 초기화"""
-    df = load_data()
-    if df is None or df.empty:
+    bank = load_data()
+    if bank is None or len(bank) == 0:
         st.error("데이터를 불러올 수 없습니다. 데이터셋을 확인해주세요.")
         return
 
-    st.session_state.questions = df.sample(n=10, random_state=42)
+    cancel_prefetch()
+    # 매번 다른 10문제 (행 번호만 저장)
+    st.session_state.question_indices = bank.sample(10).tolist()
     st.session_state.current_step = 'quiz'
     st.session_state.current_question_index = 0
     st.session_state.wrong_questions = []
-    st.session_state.misconceptions = []
+    st.session_state.wrong_answers = []
     st.session_state.generated_questions = []
+    st.session_state.similar_question_cache = {}
+    st.session_state.similar_question_refresh = set()
     logger.info("Quiz started")
 
 
-def generate_similar_question(wrong_q, misconception_id, generator):
-    """유사 문제 생성"""
+def generate_similar_question(wrong_q, wrong_answer, misconception_id, generator, on_field=None, refresh=False):
+    """유사 문제 생성 (on_field가 있으면 스트리밍으로 생성하며 완성된 줄마다 호출, refresh면 응답 캐시를 건너뜀)"""
     logger.info(f"Generating similar question for misconception_id: {misconception_id}")
     
     # 입력 데이터 유효성 검사
@@ -89,53 +109,135 @@ def generate_similar_question(wrong_q, misconception_id, generator):
         return None
         
     try:
-        # 데이터 준비 (튜플 변환 방지)
-        input_data = {
-            'construct_name': str(wrong_q.get('ConstructName', '')),
-            'subject_name': str(wrong_q.get('SubjectName', '')),
-            'question_text': str(wrong_q.get('QuestionText', '')),
-            'correct_answer_text': str(wrong_q.get(f'Answer{wrong_q["CorrectAnswer"]}Text', '')),
-            'wrong_answer_text': str(wrong_q.get(f'Answer{st.session_state.selected_wrong_answer}Text', '')),
-            'misconception_id': int(misconception_id)
-        }
-        
-        logger.info(f"Prepared input data: {input_data}")
-        
-        # 유사 문제 생성 호출
-        generated_q, _ = generator.generate_similar_question_with_text(
-            construct_name=input_data['construct_name'],
-            subject_name=input_data['subject_name'],
-            question_text=input_data['question_text'],
-            correct_answer_text=input_data['correct_answer_text'],
-            wrong_answer_text=input_data['wrong_answer_text'],
-            misconception_id=input_data['misconception_id']
-        )
-        
-        if generated_q:
-            return {
-                'question': generated_q.question,
-                'choices': generated_q.choices,
-                'correct': generated_q.correct_answer,
-                'explanation': generated_q.explanation
-            }
-            
+        return run_generation(generator, build_generation_input(wrong_q, wrong_answer, misconception_id), on_field, refresh)
     except Exception as e:
         logger.error(f"Error in generate_similar_question: {str(e)}")
         st.error(f"문제 생성 중 오류가 발생했습니다: {str(e)}")
         return None
 
+def build_generation_input(wrong_q, wrong_answer, misconception_id):
+    """generate_similar_question_with_text에 넘길 인자 준비 (튜플 변환 방지)"""
+    return {
+        'construct_name': str(wrong_q.get('ConstructName', '')),
+        'subject_name': str(wrong_q.get('SubjectName', '')),
+        'question_text': str(wrong_q.get('QuestionText', '')),
+        'correct_answer_text': str(wrong_q.get(f'Answer{wrong_q["CorrectAnswer"]}Text', '')),
+        'wrong_answer_text': str(wrong_q.get(f'Answer{wrong_answer}Text', '')),
+        'misconception_id': int(misconception_id)
+    }
+
+def run_generation(generator, input_data, on_field=None, refresh=False):
+    """
+    유사 문제 생성 호출 후 화면 표시용 dict로 변환.
+    백그라운드 스레드에서도 호출되므로 st.* 함수를 사용하지 않습니다 (on_field 콜백은 호출한 쪽 책임).
+    refresh=True면 LLM 응답 캐시를 건너뛰어 같은 입력으로도 새 문제를 받습니다.
+    """
+    logger.info(f"Prepared input data: {input_data}")
+    options = {'refresh': True} if refresh else {}
+    if on_field is not None:
+        generated_q, _ = generator.generate_similar_question_with_text(**input_data, on_field=on_field, **options)
+    else:
+        generated_q, _ = generator.generate_similar_question_with_text(**input_data, **options)
+    if generated_q:
+        return {
+            'question': generated_q.question,
+            'choices': generated_q.choices,
+            'correct': generated_q.correct_answer,
+            'explanation': generated_q.explanation
+        }
     return None
 
-def handle_answer(answer, current_q):
-    """답변 처리"""
+def streaming_preview(placeholder):
+    """스트리밍 생성 중 완성된 문제/보기 줄을 placeholder에 바로 표시하는 on_field 콜백"""
+    fields = {}
+
+    def on_field(field, value):
+        fields[field] = value
+        lines = ["### 🎯 유사 문제 (생성 중...)"]
+        if 'question' in fields:
+            lines.append(fields['question'])
+        lines.extend(f"{option}) {fields[option]}" for option in ['A', 'B', 'C', 'D'] if option in fields)
+        placeholder.markdown("\n\n".join(lines))
+
+    return on_field
+
+def similar_question_key(wrong_q, wrong_answer, misconception_id):
+    """유사 문제 캐시 키: (QuestionId, 선택한 오답, misconception_id)"""
+    mid = None if pd.isna(misconception_id) else int(misconception_id)
+    return (wrong_q.get('QuestionId'), wrong_answer, mid)
+
+def get_similar_question(wrong_q, wrong_answer, misconception_id, generator):
+    """
+    세션에 캐시된 유사 문제를 반환하고, 없을 때만 새로 생성.
+    rerun마다 API를 다시 호출하거나 문제가 바뀌지 않도록 합니다.
+    """
+    cache = st.session_state.setdefault('similar_question_cache', {})
+    key = similar_question_key(wrong_q, wrong_answer, misconception_id)
+    if key in cache:
+        logger.debug(f"Similar question cache hit: {key}")
+        return cache[key]
+
+    new_question = None
+    future = st.session_state.setdefault('similar_question_futures', {}).pop(key, None)
+    if future is not None and not future.cancelled():
+        # 퀴즈 중에 시작한 생성 결과를 기다림 (대부분 이미 완료된 상태)
+        try:
+            new_question = future.result()
+            logger.info(f"Using prefetched similar question: {key}")
+        except Exception as e:
+            logger.error(f"Prefetch failed for {key}: {e}")
+
+    if new_question is None:
+        # 미리 생성된 문제가 없으면 스트리밍으로 생성하면서 완성된 줄부터 보여줌
+        # 학생이 새 문제를 요청한 경우에는 LLM 응답 캐시의 같은 문제를 다시 받지 않도록 refresh
+        refresh = key in st.session_state.setdefault('similar_question_refresh', set())
+        preview = st.empty()
+        new_question = generate_similar_question(
+            wrong_q, wrong_answer, misconception_id, generator, on_field=streaming_preview(preview), refresh=refresh
+        )
+        preview.empty()
+    # 생성 실패는 캐시하지 않음 (다시 열면 재시도)
+    if new_question:
+        cache[key] = new_question
+        st.session_state['similar_question_refresh'].discard(key)
+    return new_question
+
+def discard_similar_question(wrong_q, wrong_answer, misconception_id):
+    """학생이 새 문제를 요청한 경우 캐시된 유사 문제를 버리고, 다음 생성은 응답 캐시를 건너뛰도록 표시"""
+    key = similar_question_key(wrong_q, wrong_answer, misconception_id)
+    st.session_state.setdefault('similar_question_cache', {}).pop(key, None)
+    st.session_state.setdefault('similar_question_refresh', set()).add(key)
+
+def prefetch_similar_question(wrong_q, wrong_answer, misconception_id, generator):
+    """오답 직후 유사 문제 생성을 백그라운드에서 미리 시작"""
+    if pd.isna(misconception_id):
+        return
+    key = similar_question_key(wrong_q, wrong_answer, misconception_id)
+    futures = st.session_state.setdefault('similar_question_futures', {})
+    if key in futures or key in st.session_state.setdefault('similar_question_cache', {}):
+        return
+    input_data = build_generation_input(wrong_q, wrong_answer, misconception_id)
+    futures[key] = get_prefetch_executor().submit(run_generation, generator, input_data)
+    logger.info(f"Prefetch started: {key}")
+
+def cancel_prefetch():
+    """세션 초기화 시 아직 시작하지 않은 prefetch 작업 취소 (실행 중인 작업의 결과는 버림)"""
+    futures = st.session_state.get('similar_question_futures', {})
+    for future in futures.values():
+        future.cancel()
+    futures.clear()
+
+def handle_answer(answer, question_index, current_q):
+    """답변 처리 (question_index: 문제 은행의 행 번호)"""
     if answer != current_q['CorrectAnswer']:
-        wrong_q_dict = current_q.to_dict()
-        st.session_state.wrong_questions.append(wrong_q_dict)
+        st.session_state.wrong_questions.append(question_index)
+        st.session_state.wrong_answers.append(answer)
         st.session_state.selected_wrong_answer = answer
-        
-        misconception_key = f'Misconception{answer}Id'
-        misconception_id = current_q.get(misconception_key)
-        st.session_state.misconceptions.append(misconception_id)
+
+        misconception_id = load_data().misconception_id(question_index, answer)
+
+        # 남은 문제를 푸는 동안 유사 문제를 미리 생성
+        prefetch_similar_question(current_q, answer, misconception_id, load_question_generator())
     
     st.session_state.current_question_index += 1
     if st.session_state.current_question_index >= 10:
@@ -157,7 +259,9 @@ def main():
 
     # 퀴즈 화면
     elif st.session_state.current_step == 'quiz':
-        current_q = st.session_state.questions.iloc[st.session_state.current_question_index]
+        bank = load_data()
+        question_index = st.session_state.question_indices[st.session_state.current_question_index]
+        current_q = bank.row(question_index)
         
         # 진행 상황 표시
         progress = st.session_state.current_question_index / 10
@@ -172,17 +276,17 @@ def main():
         col1, col2 = st.columns(2)
         with col1:
             if st.button(f"A) {current_q['AnswerAText']}", key="A"):
-                handle_answer('A', current_q)
+                handle_answer('A', question_index, current_q)
                 st.rerun()
             if st.button(f"C) {current_q['AnswerCText']}", key="C"):
-                handle_answer('C', current_q)
+                handle_answer('C', question_index, current_q)
                 st.rerun()
         with col2:
             if st.button(f"B) {current_q['AnswerBText']}", key="B"):
-                handle_answer('B', current_q)
+                handle_answer('B', question_index, current_q)
                 st.rerun()
             if st.button(f"D) {current_q['AnswerDText']}", key="D"):
-                handle_answer('D', current_q)
+                handle_answer('D', question_index, current_q)
                 st.rerun()
 
     # 복습 화면
@@ -216,16 +320,20 @@ def main():
                 st.rerun()
         with col2:
             if st.button("🏠 처음으로 돌아가기", use_container_width=True):
+                cancel_prefetch()
                 st.session_state.clear()
                 st.rerun()
         
         # 틀린 문제 분석
         if st.session_state.wrong_questions:
             st.write("### ✍️ 틀린 문제 분석")
-            for i, (wrong_q, misconception_id) in enumerate(zip(
+            bank = load_data()
+            for i, (question_index, wrong_answer) in enumerate(zip(
                 st.session_state.wrong_questions,
-                st.session_state.misconceptions
+                st.session_state.wrong_answers
             )):
+                wrong_q = bank.row(question_index)
+                misconception_id = bank.misconception_id(question_index, wrong_answer)
                 with st.expander(f"📝 틀린 문제 #{i + 1}"):
                     st.write("**📋 문제:**")
                     st.write(wrong_q['QuestionText'])
@@ -233,7 +341,7 @@ def main():
                     
                     st.write("---")
                     st.write("**🔍 관련된 Misconception:**")
-                    if misconception_id and not pd.isna(misconception_id):
+                    if not pd.isna(misconception_id) and misconception_id:
                         misconception_text = generator.get_misconception_text(misconception_id)
                         st.info(f"Misconception ID: {int(misconception_id)}\n\n{misconception_text}")
                     else:
@@ -250,7 +358,7 @@ def main():
                     # 유사 문제가 생성된 상태인 경우
                     if st.session_state.get(f"show_similar_question_{i}", False):
                         with st.spinner("유사 문제를 생성하고 있습니다..."):
-                            new_question = generate_similar_question(wrong_q, misconception_id, generator)
+                            new_question = get_similar_question(wrong_q, wrong_answer, misconception_id, generator)
                             if new_question:
                                 st.write("### 🎯 유사 문제")
                                 st.write(new_question['question'])
@@ -303,6 +411,13 @@ def main():
                                         st.session_state[f"selected_answer_{i}"] = None
                                         st.rerun()
                                 
+                                # 새 유사 문제 요청 버튼 (캐시된 문제를 버리고 다시 생성)
+                                if st.button("🆕 새로운 유사 문제", key=f"regenerate_{i}"):
+                                    discard_similar_question(wrong_q, wrong_answer, misconception_id)
+                                    st.session_state[f"similar_question_answered_{i}"] = False
+                                    st.session_state[f"selected_answer_{i}"] = None
+                                    st.rerun()
+
                                 # 문제 닫기 버튼
                                 if st.button("❌ 문제 닫기", key=f"close_{i}"):
                                     st.session_state[f"show_similar_question_{i}"] = False
@@ -315,6 +430,3 @@ def main():
 if __name__ == "__main__":
     main()
 
-# random_state 42에서 정답
-    # D C A A C
-    # A B B B B
@@ -0,0 +1,210 @@
+# ann_index.py
+# misconception 임베딩용 근사 최근접 이웃(IVF) 인덱스 - numpy만 사용
+import argparse
+import logging
+import os
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+from src.FisrtModule.retrieval import top_k_rows, l2_normalize, top_k_similar
+
+logger = logging.getLogger(__name__)
+
+
+class IVFIndex:
+    """
+    Inverted-file 인덱스 (spherical k-means로 n_lists개 군집을 만들고,
+    질의마다 가까운 n_probe개 군집 안에서만 cosine similarity를 계산).
+
+    exact=True로 검색하거나 n_probe >= n_lists이면 전체 탐색과 결과가 같습니다.
+    """
+
+    def __init__(self, n_lists: Optional[int] = None, n_probe: int = 8):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.centroids = None   # (n_lists, d)
+        self.vectors = None     # (n, d) 군집 순서로 정렬된 정규화 벡터
+        self.ids = None         # (n,) vectors의 원래 행 index
+        self.offsets = None     # (n_lists + 1,) 군집별 vectors 구간
+
+    def __len__(self) -> int:
+        return 0 if self.ids is None else len(self.ids)
+
+    def build(self, embs: np.ndarray, n_iter: int = 10, seed: int = 0) -> "IVFIndex":
+        vectors = l2_normalize(embs)
+        n = len(vectors)
+        n_lists = self.n_lists or max(1, int(np.sqrt(n)))
+        n_lists = min(n_lists, n)
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(n, n_lists, replace=False)].copy()
+
+        for _ in range(n_iter):
+            assign = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, vectors)
+            counts = np.bincount(assign, minlength=n_lists)
+            empty = counts == 0
+            # 빈 군집은 임의의 벡터로 다시 초기화
+            sums[empty] = vectors[rng.choice(n, int(empty.sum()), replace=False)]
+            centroids = l2_normalize(sums)
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+
+        order = np.argsort(assign, kind="stable")
+        self.n_lists = n_lists
+        self.centroids = centroids
+        self.vectors = vectors[order]
+        self.ids = order.astype(np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))]).astype(np.int64)
+        logger.info(f"Built IVF index: {n} vectors, {n_lists} lists")
+        return self
+
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int = 25,
+        n_probe: Optional[int] = None,
+        exact: bool = False
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        질의마다 상위 k개의 (원래 행 index, score)를 반환.
+        후보가 k개보다 적으면 나머지는 index -1, score -inf로 채웁니다.
+        """
+        queries = l2_normalize(queries)
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        if exact or n_probe >= self.n_lists:
+            indices, scores = top_k_similar(queries, self.vectors, k, normalize=False)
+            return self.ids[indices], scores
+
+        probe_lists = np.argpartition(-(queries @ self.centroids.T), n_probe - 1, axis=1)[:, :n_probe]
+
+        # 군집별로 그 군집을 탐색하는 질의들을 모아 한 번의 행렬곱으로 계산하고,
+        # (질의, probe 순번)마다 군집 내 상위 k개를 버퍼에 기록
+        candidate_ids = np.full((len(queries), n_probe, k), -1, dtype=np.int64)
+        candidate_scores = np.full((len(queries), n_probe, k), -np.inf, dtype=np.float32)
+        flat_order = np.argsort(probe_lists.ravel(), kind="stable")
+        flat_lists = probe_lists.ravel()[flat_order]
+        boundaries = np.flatnonzero(np.diff(flat_lists)) + 1
+        for entries in np.split(flat_order, boundaries):
+            if len(entries) == 0:
+                continue
+            list_id = probe_lists.ravel()[entries[0]]
+            start, end = self.offsets[list_id], self.offsets[list_id + 1]
+            if start == end:
+                continue
+            rows, slots = entries // n_probe, entries % n_probe
+            sims = queries[rows] @ self.vectors[start:end].T
+            top_positions, top_scores = top_k_rows(sims, k)
+            width = top_positions.shape[1]
+            candidate_ids[rows, slots, :width] = self.ids[start + top_positions]
+            candidate_scores[rows, slots, :width] = top_scores
+
+        candidate_ids = candidate_ids.reshape(len(queries), -1)
+        best, scores = top_k_rows(candidate_scores.reshape(len(queries), -1), k)
+        return np.take_along_axis(candidate_ids, best, axis=1), scores
+
+    def save(self, path: str):
+        # 파일 핸들로 저장해 np.savez가 경로에 .npz를 덧붙이지 않도록 함 (load(path)와 같은 경로)
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                vectors=self.vectors,
+                ids=self.ids,
+                offsets=self.offsets,
+                n_probe=np.array(self.n_probe),
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as data:
+            index = cls(n_lists=len(data["centroids"]), n_probe=int(data["n_probe"]))
+            index.centroids = data["centroids"]
+            index.vectors = data["vectors"]
+            index.ids = data["ids"]
+            index.offsets = data["offsets"]
+        return index
+
+
+def load_or_build_index(
+    embeddings_path: str,
+    embs: np.ndarray,
+    index_dir: Optional[str] = None,
+    n_lists: Optional[int] = None,
+    n_probe: int = 8
+) -> IVFIndex:
+    """
+    임베딩 파일마다 IVF 인덱스를 한 번만 만들어 index_dir(기본: 임베딩 파일과 같은 폴더)에 저장하고 재사용.
+    파일 이름에 임베딩 파일의 크기와 수정 시각을 넣어, 임베딩이 바뀌면 다시 만듭니다.
+    저장할 수 없는 위치면 메모리에만 둡니다.
+    """
+    stat = os.stat(embeddings_path)
+    stem = os.path.splitext(os.path.basename(embeddings_path))[0]
+    index_dir = index_dir or os.path.dirname(os.path.abspath(embeddings_path))
+    path = os.path.join(index_dir, f"{stem}.ivf-{n_lists or 'auto'}.{stat.st_size}-{int(stat.st_mtime)}.npz")
+
+    if os.path.exists(path):
+        index = IVFIndex.load(path)
+        if len(index) == len(embs):
+            index.n_probe = n_probe
+            logger.info(f"Loaded IVF index from {path}")
+            return index
+        logger.warning(f"Ignoring IVF index with {len(index)} rows (expected {len(embs)}): {path}")
+
+    index = IVFIndex(n_lists=n_lists, n_probe=n_probe).build(embs)
+    try:
+        os.makedirs(index_dir, exist_ok=True)
+        # 임시 파일에 쓰고 교체해서, 다른 프로세스가 쓰다 만 인덱스를 읽지 않도록 함
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        index.save(tmp_path)
+        os.replace(tmp_path, path)
+        logger.info(f"Saved IVF index to {path}")
+    except OSError as e:
+        logger.warning(f"Could not save IVF index to {path}: {e}")
+    return index
+
+
+def benchmark_recall(index: IVFIndex, queries: np.ndarray, k: int = 25, n_probe: Optional[int] = None) -> dict:
+    """exact 검색 대비 recall@k와 질의당 평균 지연 시간(ms)"""
+    start = time.perf_counter()
+    exact_indices, _ = index.search(queries, k, exact=True)
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    start = time.perf_counter()
+    ann_indices, _ = index.search(queries, k, n_probe=n_probe)
+    ann_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    recall = np.mean([len(set(a) & set(e)) / k for a, e in zip(ann_indices, exact_indices)])
+    return {"recall": float(recall), "exact_ms_per_query": exact_ms, "ann_ms_per_query": ann_ms}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IVF 인덱스 생성 및 recall@k 벤치마크")
+    parser.add_argument("embeddings", help="misconception 임베딩 .npy 경로")
+    parser.add_argument("--n-lists", type=int, default=None)
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--k", type=int, default=25)
+    parser.add_argument("--queries", type=int, default=1000, help="벤치마크용 질의 수 (임베딩에 noise를 더해 생성)")
+    parser.add_argument("--scale", type=int, default=1, help="카탈로그를 몇 배로 늘려 측정할지 (noise를 더한 복제)")
+    parser.add_argument("--save", default=None, help="인덱스를 저장할 .npz 경로")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    embs = np.load(args.embeddings).astype(np.float32)
+    catalog = np.concatenate([embs] + [
+        embs + rng.normal(scale=0.05, size=embs.shape).astype(np.float32) for _ in range(args.scale - 1)
+    ])
+    queries = catalog[rng.choice(len(catalog), args.queries)] + rng.normal(scale=0.05, size=(args.queries, embs.shape[1])).astype(np.float32)
+
+    start = time.perf_counter()
+    index = IVFIndex(n_lists=args.n_lists).build(catalog)
+    print(f"catalog={len(catalog)} lists={index.n_lists} build={time.perf_counter() - start:.2f}s")
+    for n_probe in args.n_probe:
+        result = benchmark_recall(index, queries, k=args.k, n_probe=n_probe)
+        print(
+            f"n_probe={n_probe}: recall@{args.k}={result['recall']:.4f} "
+            f"exact={result['exact_ms_per_query']:.3f}ms ann={result['ann_ms_per_query']:.3f}ms per query"
+        )
+    if args.save:
+        index.save(args.save)
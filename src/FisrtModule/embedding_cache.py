@@ -0,0 +1,177 @@
+# embedding_cache.py
+# anchor 텍스트 임베딩 캐시 (메모리 LRU + 디스크 .npy chunk 저장소)
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class QueryEmbeddingCache:
+    """
+    (model name, normalize 여부, anchor 텍스트 해시)를 키로 질의 임베딩을 캐시.
+
+    - 메모리: 최근 사용한 memory_size개를 LRU로 유지
+    - 디스크: cache_dir/<model+normalize 해시>/ 아래에 새로 계산한 임베딩을
+      chunk-<고유 id>.npy (행렬) + chunk-<고유 id>.json (행별 텍스트 해시)로 추가 저장.
+      chunk 이름은 프로세스/인스턴스마다 겹치지 않으므로 여러 writer가 같은 디렉터리를 써도 서로 덮어쓰지 않음.
+      기존 chunk는 memory-map으로 읽으므로 캐시 크기만큼 메모리를 쓰지 않음
+    - chunk가 max_chunks개를 넘으면 (로드 시 또는 새 chunk를 쓴 뒤) 작은 chunk 절반을 하나로 합쳐
+      파일 수와 열어 둔 memory-map 수가 계속 늘지 않도록 함 (큰 chunk는 자주 다시 쓰지 않음)
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, normalize: bool = True, memory_size: int = 10000, max_chunks: int = 32):
+        self.model_name = model_name
+        self.normalize = normalize
+        self.memory_size = memory_size
+        self.max_chunks = max(2, max_chunks)
+        namespace = text_hash(json.dumps({"model": model_name, "normalize": normalize}))[:16]
+        self.directory = os.path.join(cache_dir, namespace)
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._chunks: List[np.ndarray] = []
+        self._chunk_files: List[Tuple[str, List[str]]] = []  # chunk별 (파일 경로(확장자 제외), 행별 키)
+        self._disk_index: Dict[str, Tuple[int, int]] = {}  # 텍스트 해시 → (chunk 번호, 행)
+        self._load_disk_index()
+        while len(self._chunks) > self.max_chunks:
+            self._compact()
+
+    def _add_chunk(self, base: str, keys: List[str], chunk: np.ndarray):
+        chunk_id = len(self._chunks)  # 이 인스턴스 안에서의 번호 (파일 이름과 무관)
+        self._chunks.append(chunk)
+        self._chunk_files.append((base, keys))
+        for row, key in enumerate(keys):
+            self._disk_index[key] = (chunk_id, row)
+
+    def _compact(self):
+        """크기가 작은 chunk 절반을 하나의 chunk로 합치고 원래 파일은 삭제"""
+        order = sorted(range(len(self._chunks)), key=lambda i: len(self._chunks[i]))
+        merge = set(order[:max(2, len(order) // 2)])
+        merged_keys, merged_rows = [], []
+        for chunk_id in sorted(merge):
+            _, keys = self._chunk_files[chunk_id]
+            merged_keys.extend(keys)
+            merged_rows.append(np.asarray(self._chunks[chunk_id], dtype=np.float32))
+        removed = [self._chunk_files[i][0] for i in sorted(merge)]
+
+        kept = [i for i in range(len(self._chunks)) if i not in merge]
+        chunks, chunk_files = [self._chunks[i] for i in kept], [self._chunk_files[i] for i in kept]
+        self._chunks, self._chunk_files, self._disk_index = [], [], {}
+        for (base, keys), chunk in zip(chunk_files, chunks):
+            self._add_chunk(base, keys, chunk)
+        self._write_chunk(merged_keys, np.concatenate(merged_rows))
+
+        # 합친 chunk를 쓴 뒤에 원래 파일 삭제 (.json을 먼저 지워 다른 프로세스가 반쪽 chunk를 읽지 않게 함).
+        # 다른 프로세스가 이미 열어 둔 memory-map은 삭제 후에도 유효하고, 동시에 지워 없는 파일은 무시
+        for base in removed:
+            for suffix in (".json", ".npy"):
+                try:
+                    os.remove(base + suffix)
+                except OSError:
+                    pass
+        logger.info(f"Compacted {len(removed)} embedding cache chunks into one ({len(merged_keys)} rows)")
+
+    def _load_disk_index(self):
+        for keys_path in sorted(glob.glob(os.path.join(self.directory, "chunk-*.json"))):
+            with open(keys_path, encoding="utf-8") as f:
+                keys = json.load(f)
+            chunk = np.load(keys_path[:-len(".json")] + ".npy", mmap_mode="r")
+            if len(chunk) != len(keys):
+                logger.warning(f"Skipping inconsistent embedding cache chunk: {keys_path}")
+                continue
+            self._add_chunk(keys_path[:-len(".json")], keys, chunk)
+        logger.info(f"Query embedding cache: {len(self._disk_index)} embeddings on disk in {self.directory}")
+
+    def _remember(self, key: str, embedding: np.ndarray):
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, key: str):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        location = self._disk_index.get(key)
+        if location is None:
+            return None
+        chunk_id, row = location
+        embedding = np.asarray(self._chunks[chunk_id][row])
+        self._remember(key, embedding)
+        return embedding
+
+    def _write_chunk(self, keys: List[str], embeddings: np.ndarray):
+        base = os.path.join(self.directory, f"chunk-{uuid.uuid4().hex}")
+        # 두 파일 모두 임시 파일에 쓰고 교체. .npy를 먼저, .json을 마지막에 써서 중간에 실패한 chunk는 로드 시 무시되도록 함
+        tmp_path = f"{base}.npy.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, embeddings)
+        os.replace(tmp_path, base + ".npy")
+        tmp_path = f"{base}.json.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(keys, f)
+        os.replace(tmp_path, base + ".json")
+        self._add_chunk(base, keys, np.load(base + ".npy", mmap_mode="r"))
+
+    def encode(self, model, texts: Sequence[str], **encode_kwargs) -> np.ndarray:
+        """
+        model.encode와 같은 (len(texts), dim) 행렬을 반환.
+        캐시에 없는 텍스트만 중복 없이 모아 한 번에 model.encode로 계산합니다.
+        """
+        texts = [str(text) for text in texts]
+        keys = [text_hash(text) for text in texts]
+        with self._lock:
+            found = {}
+            missing: "OrderedDict[str, str]" = OrderedDict()
+            for key, text in zip(keys, texts):
+                if key in found or key in missing:
+                    continue
+                embedding = self._lookup(key)
+                if embedding is None:
+                    missing[key] = text
+                else:
+                    found[key] = embedding
+            self.hits += len(found)
+            self.misses += len(missing)
+
+        if missing:
+            logger.info(f"Encoding {len(missing)} uncached anchors ({len(found)} cached)")
+            new_embeddings = np.asarray(
+                model.encode(list(missing.values()), normalize_embeddings=self.normalize, **encode_kwargs),
+                dtype=np.float32,
+            )
+            with self._lock:
+                self._write_chunk(list(missing), new_embeddings)
+                while len(self._chunks) > self.max_chunks:
+                    self._compact()
+                for key, embedding in zip(missing, new_embeddings):
+                    self._remember(key, embedding)
+                    found[key] = embedding
+
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+            "disk_entries": len(self._disk_index),
+        }
@@ -0,0 +1,75 @@
+# embedding_store.py
+# misconception 임베딩(.npy)을 memory-map으로 한 번만 열어 앙상블/프로세스 간에 공유하는 저장소
+import json
+import logging
+import os
+from functools import lru_cache
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+@lru_cache(maxsize=None)
+def _open_matrix(abs_path: str, mtime: float) -> np.ndarray:
+    # mmap_mode='r': 파일 페이지를 OS page cache로 공유 (프로세스마다 복사본을 만들지 않음)
+    matrix = np.load(abs_path, mmap_mode='r')
+    if matrix.ndim != 2:
+        raise ValueError(f"임베딩 행렬은 2차원이어야 합니다: {abs_path} shape={matrix.shape}")
+    logger.info(f"Memory-mapped misconception embeddings {abs_path} shape={matrix.shape} dtype={matrix.dtype}")
+    return matrix
+
+
+def load_embeddings(npy_path: str, expected_rows: Optional[int] = None) -> np.ndarray:
+    """
+    .npy 임베딩 행렬을 읽기 전용 memory-map으로 반환.
+    같은 파일은 (변경되지 않는 한) 프로세스 내에서 한 번만 열고 같은 배열을 돌려줍니다.
+    expected_rows가 주어지면 misconception 수와 행 수가 일치하는지 확인합니다.
+    """
+    abs_path = os.path.abspath(npy_path)
+    matrix = _open_matrix(abs_path, os.path.getmtime(abs_path))
+    if expected_rows is not None and matrix.shape[0] != expected_rows:
+        raise ValueError(
+            f"임베딩 행 수({matrix.shape[0]})가 misconception 수({expected_rows})와 다릅니다: {abs_path}"
+        )
+    return matrix
+
+
+class MisconceptionEmbeddingStore:
+    """
+    모델별 misconception 임베딩 모음.
+
+    manifest.json 예시 (버전이 있는 다중 모델 파일):
+        {"version": 1, "num_misconceptions": 2587,
+         "models": {"minsuas/Misconceptions__1": "embs_misconception-9-9.npy"}}
+    """
+
+    def __init__(self, paths: Dict[str, str], expected_rows: Optional[int] = None):
+        self.paths = dict(paths)
+        self.expected_rows = expected_rows
+
+    @classmethod
+    def from_manifest(cls, manifest_path: str, expected_rows: Optional[int] = None) -> "MisconceptionEmbeddingStore":
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"지원하지 않는 manifest 버전입니다: {manifest.get('version')}")
+        num_rows = manifest.get("num_misconceptions")
+        if expected_rows is not None and num_rows is not None and num_rows != expected_rows:
+            raise ValueError(f"manifest의 misconception 수({num_rows})가 매핑({expected_rows})과 다릅니다.")
+        base_dir = os.path.dirname(os.path.abspath(manifest_path))
+        paths = {name: os.path.join(base_dir, path) for name, path in manifest["models"].items()}
+        return cls(paths, expected_rows if expected_rows is not None else num_rows)
+
+    def __contains__(self, model_name: str) -> bool:
+        return model_name in self.paths
+
+    def model_names(self):
+        return list(self.paths)
+
+    def get(self, model_name: str) -> np.ndarray:
+        """모델의 임베딩 행렬 (읽기 전용 memory-map, 호출마다 같은 배열)"""
+        return load_embeddings(self.paths[model_name], self.expected_rows)
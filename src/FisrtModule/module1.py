@@ -1,17 +1,17 @@
 ### module1.py
-# Misconception을 예측하는 모듈 (나중에 따로 구현 후 그 모델을 불러오는 식으로 구현 할 예정이며, 아직은 mock모듈)
+# Misconception을 예측하는 모듈
+# retriever(MisconceptionRetriever)가 주어지면 실제 검색으로 예측하고, 없으면 row의 라벨을 그대로 쓰는 mock으로 동작
 import pandas as pd
+from src.misconception_catalog import load_catalog
 
 class MisconceptionPredictor:
-    def __init__(self, misconception_csv_path='misconception_mapping.csv'):
-        self.misconception_df = pd.read_csv(misconception_csv_path)
+    def __init__(self, misconception_csv_path='misconception_mapping.csv', retriever=None):
+        self.catalog = load_catalog(misconception_csv_path)
+        self.retriever = retriever
     
     def get_misconception_text(self, misconception_id: int) -> str:
-        row = self.misconception_df[self.misconception_df['MisconceptionId'] == misconception_id]
-        if not row.empty:
-            return row.iloc[0]['MisconceptionName']
         # 해당 id에 대한 misconception이 없으면 기본 텍스트
-        return "There is no misconception"
+        return self.catalog.get(misconception_id, "There is no misconception")
     
     def predict_misconception(self, 
                               construct_name: str, 
@@ -25,6 +25,12 @@ class MisconceptionPredictor:
         틀린 선지(wrong_answer)에 해당하는 MisconceptionXId를 row에서 찾고,
         해당 ID의 misconception text를 misconception_mapping에서 찾아 반환.
         """
+        if self.retriever is not None:
+            return self.retriever.predict_misconception(
+                construct_name, subject_name, question_text,
+                correct_answer_text, wrong_answer_text, wrong_answer, row
+            )
+
         # wrong_answer에 따라 MisconceptionXId 컬럼명 결정
         misconception_col = f"Misconception{wrong_answer}Id"
         if misconception_col not in row:
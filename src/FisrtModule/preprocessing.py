@@ -0,0 +1,155 @@
+# preprocessing.py
+# 검색 파이프라인용 데이터 전처리 (wide → long 변환, anchor 프롬프트 생성) - pandas 벡터 연산 버전
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+OPTIONS = ["A", "B", "C", "D"]
+
+# 쿼리(anchor) 프롬프트
+ANCHOR_PROMPT = (
+    "Subject: {SubjectName}\n"
+    "Construct: {ConstructName}\n"
+    "Question: {QuestionText}\n"
+    "Incorrect Answer: {AnswerText}"
+)
+
+
+# 데이터 전처리
+def preprocess(df):
+    df_new = df.copy()
+
+    # 문자열 처리: object뿐 아니라 pandas 3의 str 열과 캐시된 문제 은행(question_bank)의 category 열도 공백 제거
+    # (CSV를 직접 읽었는지, pandas 버전이 무엇인지와 관계없이 같은 anchor가 나오도록)
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df_new[col] = df_new[col].astype(object).str.strip()
+        elif pd.api.types.is_string_dtype(df[col].dtype):
+            df_new[col] = df_new[col].str.strip()
+
+    # AnswerText 처리
+    for option in OPTIONS:
+        df_new[f"Answer{option}Text"] = df_new[f"Answer{option}Text"].str.replace("Only\n", "Only ")
+
+    return df_new
+
+
+def wide_to_long(df):
+    """
+    문제 한 행(A~D 보기)을 오답 보기마다 한 행으로 펼침.
+    iterrows 대신 보기별로 열을 잘라 이어 붙인 뒤 (문제 순서, 보기 순서)로 정렬합니다.
+    """
+    is_train = "MisconceptionAId" in df.columns
+    base_columns = list(df.columns[:df.columns.get_loc("QuestionText") + 1])
+    correct_text = np.select(
+        [df["CorrectAnswer"].to_numpy() == option for option in OPTIONS],
+        [df[f"Answer{option}Text"].to_numpy() for option in OPTIONS],
+        default=None,
+    )
+
+    parts = []
+    for option_order, option in enumerate(OPTIONS):
+        part = df[base_columns].copy()
+        part["CorrectAnswerText"] = correct_text
+        part["Answer"] = option
+        part["AnswerText"] = df[f"Answer{option}Text"]
+        if is_train:
+            part["MisconceptionId"] = df[f"Misconception{option}Id"]
+        part["_row"] = np.arange(len(df))
+        part["_option"] = option_order
+        parts.append(part[df["CorrectAnswer"] != option])
+
+    df_long = (
+        pd.concat(parts)
+        .sort_values(["_row", "_option"], kind="stable")
+        .drop(columns=["_row", "_option"])
+        .reset_index(drop=True)
+    )
+    df_long.insert(0, "QuestionId_Answer", df_long["QuestionId"].astype(str) + "_" + df_long["Answer"])
+    df_long = df_long.drop(["Answer", "CorrectAnswer"], axis=1)
+
+    return df_long
+
+
+def build_anchors(df_long) -> pd.Series:
+    """ANCHOR_PROMPT.format(...)과 같은 문자열을 행마다 벡터 연산으로 생성"""
+    return (
+        "Subject: " + df_long["SubjectName"].astype(str)
+        + "\nConstruct: " + df_long["ConstructName"].astype(str)
+        + "\nQuestion: " + df_long["QuestionText"].astype(str)
+        + "\nIncorrect Answer: " + df_long["AnswerText"].astype(str)
+    )
+
+
+def _wide_to_long_iterrows(df):
+    """벤치마크/검증용 기존 구현 (행마다 pandas Series 생성)"""
+    is_train = "MisconceptionAId" in df.columns
+    rows = []
+
+    for _, row in df.iterrows():
+        correct_option = row["CorrectAnswer"]
+        correct_text = row[f"Answer{correct_option}Text"]
+
+        for option in OPTIONS:
+            if option == correct_option:
+                continue
+            misconception_id = row[f"Misconception{option}Id"] if is_train else np.nan
+            row_new = row[:"QuestionText"]
+            row_new["CorrectAnswerText"] = correct_text
+            row_new["Answer"] = option
+            row_new["AnswerText"] = row[f"Answer{option}Text"]
+            if is_train and not np.isnan(misconception_id):
+                row_new["MisconceptionId"] = int(misconception_id)
+            rows.append(row_new)
+
+    df_long = pd.DataFrame(rows).reset_index(drop=True)
+    df_long.insert(0, "QuestionId_Answer", df_long["QuestionId"].astype(str) + "_" + df_long["Answer"])
+    df_long = df_long.drop(["Answer", "CorrectAnswer"], axis=1)
+
+    return df_long
+
+
+def _build_anchors_iterrows(df_long):
+    return [
+        ANCHOR_PROMPT.format(
+            SubjectName=row["SubjectName"],
+            ConstructName=row["ConstructName"],
+            QuestionText=row["QuestionText"],
+            AnswerText=row["AnswerText"]
+        ) for _, row in df_long.iterrows()
+    ]
+
+
+def benchmark(csv_path: str, repeat: int = 3):
+    """기존 iterrows 구현과 벡터 구현의 결과가 같은지 확인하고 소요 시간을 비교"""
+    df = preprocess(pd.read_csv(csv_path))
+
+    def best_of(fn):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn()
+            times.append(time.perf_counter() - start)
+        return result, min(times)
+
+    legacy, legacy_time = best_of(lambda: _wide_to_long_iterrows(df))
+    vectorized, vectorized_time = best_of(lambda: wide_to_long(df))
+    pd.testing.assert_frame_equal(legacy.infer_objects(), vectorized.infer_objects(), check_dtype=False)
+
+    legacy_anchors, legacy_anchor_time = best_of(lambda: _build_anchors_iterrows(vectorized))
+    anchors, anchor_time = best_of(lambda: build_anchors(vectorized))
+    assert legacy_anchors == anchors.tolist()
+
+    print(f"rows={len(df)} long_rows={len(vectorized)} (outputs identical)")
+    print(f"wide_to_long : iterrows {legacy_time:.3f}s  vectorized {vectorized_time:.3f}s")
+    print(f"anchors      : iterrows {legacy_anchor_time:.3f}s  vectorized {anchor_time:.3f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="wide_to_long / anchor 생성 벤치마크")
+    parser.add_argument("csv_path", nargs="?", default="Data/train.csv")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    benchmark(args.csv_path, args.repeat)
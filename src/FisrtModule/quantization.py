@@ -0,0 +1,166 @@
+# quantization.py
+# misconception 임베딩 양자화(int8/float16) 후보 검색 + float 재정렬, 그리고 MAP@k / recall@k 평가
+import argparse
+import time
+from typing import Sequence, Tuple
+
+import numpy as np
+
+from src.FisrtModule.retrieval import l2_normalize, top_k_rows, top_k_similar
+
+QUANTIZATION_DTYPES = ("int8", "float16")
+
+
+class QuantizedIndex:
+    """
+    양자화한 임베딩으로 후보 rerank_k개를 고른 뒤, 원래 float 임베딩으로 그 후보만 다시 점수를 매겨 상위 k개 반환.
+
+    float_embs는 memory-map 배열(embedding_store.load_embeddings)을 그대로 넘기면
+    재정렬 때 후보 행만 읽으므로 float 행렬 전체가 메모리에 올라오지 않습니다.
+    ann_index.IVFIndex와 같은 search(queries, k) 형식이라 rank_ensemble_top_k(indexes=...)에 넣을 수 있습니다.
+    """
+
+    def __init__(self, float_embs: np.ndarray, dtype: str = "int8", rerank_factor: int = 4, chunk_size: int = 256, block_size: int = 512):
+        if dtype not in QUANTIZATION_DTYPES:
+            raise ValueError(f"지원하지 않는 양자화 형식입니다: {dtype} (가능: {QUANTIZATION_DTYPES})")
+        self.float_embs = float_embs
+        self.dtype = dtype
+        self.rerank_factor = rerank_factor
+        self.chunk_size = chunk_size
+        self.block_size = block_size
+
+        normalized = l2_normalize(float_embs)
+        # 재정렬 시 후보 행을 다시 정규화하지 않도록 행별 norm의 역수를 저장
+        norms = np.linalg.norm(np.asarray(float_embs, dtype=np.float32), axis=1)
+        self.inv_norms = (1.0 / np.maximum(norms, 1e-12)).astype(np.float32)
+        if dtype == "int8":
+            # 행별 대칭 scale: 값 = codes * scale
+            self.scales = (np.abs(normalized).max(axis=1) / 127.0).astype(np.float32)
+            self.scales[self.scales == 0] = 1.0
+            self.codes = np.round(normalized / self.scales[:, None]).astype(np.int8)
+        else:
+            self.scales = None
+            self.codes = normalized.astype(np.float16)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.inv_norms.nbytes + (0 if self.scales is None else self.scales.nbytes)
+
+    def approximate_scores(self, queries: np.ndarray) -> np.ndarray:
+        """
+        양자화 행렬과의 유사도. float 행렬 전체를 만들지 않도록 block_size 행씩만 float32로 바꿔 계산합니다.
+        """
+        sims = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+        for start in range(0, len(self.codes), self.block_size):
+            block = self.codes[start:start + self.block_size].astype(np.float32)
+            np.matmul(queries, block.T, out=sims[:, start:start + self.block_size])
+        if self.scales is not None:
+            sims *= self.scales
+        return sims
+
+    def _exact_scores(self, queries: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """정규화된 queries와 float 임베딩 rows 행의 cosine similarity (후보 행도 block_size씩만 읽음)"""
+        sims = np.empty((len(queries), len(rows)), dtype=np.float32)
+        for start in range(0, len(rows), self.block_size):
+            block = np.asarray(self.float_embs[rows[start:start + self.block_size]], dtype=np.float32)
+            np.matmul(queries, block.T, out=sims[:, start:start + self.block_size])
+        sims *= self.inv_norms[rows]
+        return sims
+
+    def search(self, queries: np.ndarray, k: int = 25) -> Tuple[np.ndarray, np.ndarray]:
+        queries = l2_normalize(queries)
+        rerank_k = min(len(self), max(k, k * self.rerank_factor))
+        indices, scores = [], []
+        for start in range(0, len(queries), self.chunk_size):
+            chunk = queries[start:start + self.chunk_size]
+            candidates, _ = top_k_rows(self.approximate_scores(chunk), rerank_k)
+            # 후보 행만 float 임베딩에서 읽어 정확한 cosine similarity로 재정렬
+            unique_rows, inverse = np.unique(candidates, return_inverse=True)
+            exact = np.take_along_axis(self._exact_scores(chunk, unique_rows), inverse.reshape(candidates.shape), axis=1)
+            order, chunk_scores = top_k_rows(exact, k)
+            indices.append(np.take_along_axis(candidates, order, axis=1))
+            scores.append(chunk_scores)
+        if not indices:
+            return np.empty((0, k), dtype=np.int64), np.empty((0, k), dtype=np.float32)
+        return np.concatenate(indices), np.concatenate(scores)
+
+
+def map_at_k(predictions: np.ndarray, labels: Sequence[int], k: int = 25) -> float:
+    """정답 misconception이 하나인 경우의 MAP@k (= 정답 순위의 역수 평균, k 밖이면 0)"""
+    predictions = np.asarray(predictions)[:, :k]
+    hits = predictions == np.asarray(labels)[:, None]
+    ranks = np.argmax(hits, axis=1)
+    return float(np.mean(np.where(hits.any(axis=1), 1.0 / (ranks + 1), 0.0)))
+
+
+def recall_at_k(predictions: np.ndarray, labels: Sequence[int], k: int = 25) -> float:
+    predictions = np.asarray(predictions)[:, :k]
+    return float(np.mean((predictions == np.asarray(labels)[:, None]).any(axis=1)))
+
+
+def compare_quantization(query_embs: np.ndarray, float_embs: np.ndarray, labels: Sequence[int], k: int = 25) -> dict:
+    """
+    float 전체 검색과 int8/float16 양자화 검색의 MAP@k, recall@k, 메모리, 지연 시간 비교.
+    labels는 임베딩 행 번호 기준 정답 (misconception_mapping.csv 행 순서).
+    """
+    results = {}
+    start = time.perf_counter()
+    exact, _ = top_k_similar(query_embs, float_embs, k)
+    results["float32"] = {
+        "map": map_at_k(exact, labels, k),
+        "recall": recall_at_k(exact, labels, k),
+        "overlap_with_float": 1.0,
+        "matrix_bytes": int(np.asarray(float_embs).nbytes),
+        "seconds": time.perf_counter() - start,
+    }
+    for dtype in QUANTIZATION_DTYPES:
+        index = QuantizedIndex(float_embs, dtype=dtype)
+        start = time.perf_counter()
+        predicted, _ = index.search(query_embs, k)
+        elapsed = time.perf_counter() - start
+        results[dtype] = {
+            "map": map_at_k(predicted, labels, k),
+            "recall": recall_at_k(predicted, labels, k),
+            "overlap_with_float": float(np.mean([len(set(a) & set(b)) / k for a, b in zip(predicted, exact)])),
+            "matrix_bytes": int(index.nbytes),
+            "seconds": elapsed,
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="양자화 검색의 MAP@25 / recall@25를 train 라벨로 float 검색과 비교 (retriever 모델 필요)"
+    )
+    parser.add_argument("--train-csv", default="Data/train.csv")
+    parser.add_argument("--limit", type=int, default=0, help="사용할 train 행 수 (0이면 전체)")
+    parser.add_argument("--k", type=int, default=25)
+    args = parser.parse_args()
+
+    from src.question_bank import load_question_bank
+    from src.FisrtModule.preprocessing import build_anchors, preprocess, wide_to_long
+    from src.FisrtModule.retriever import MisconceptionRetriever
+
+    retriever = MisconceptionRetriever()
+    train_df = load_question_bank(args.train_csv)
+    if args.limit:
+        train_df = train_df.iloc[:args.limit]
+    train_long = wide_to_long(preprocess(train_df)).dropna(subset=["MisconceptionId"])
+
+    # MisconceptionId → 임베딩 행 번호
+    row_of_id = {int(mid): row for row, mid in enumerate(retriever.catalog.ids)}
+    labels = [row_of_id[int(mid)] for mid in train_long["MisconceptionId"]]
+
+    retriever._load()
+    anchors = build_anchors(train_long).tolist()
+    for name, query_embs, float_embs in zip(retriever.model_paths, retriever._encode(anchors), retriever._embeddings):
+        print(f"[{name}] queries={len(anchors)}")
+        for dtype, result in compare_quantization(query_embs, float_embs, labels, args.k).items():
+            print(
+                f"  {dtype:8s} MAP@{args.k}={result['map']:.4f} recall@{args.k}={result['recall']:.4f} "
+                f"overlap={result['overlap_with_float']:.4f} matrix={result['matrix_bytes'] / 1e6:.1f}MB "
+                f"time={result['seconds']:.3f}s"
+            )
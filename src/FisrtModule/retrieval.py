@@ -0,0 +1,255 @@
+# retrieval.py
+# 질의 임베딩과 misconception 임베딩 간 top-k 검색 및 순위 앙상블 (rank-power 평균 / reciprocal rank fusion)
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+
+def l2_normalize(embs: np.ndarray) -> np.ndarray:
+    """행 단위 L2 정규화 (정규화된 벡터끼리의 내적 = cosine similarity)"""
+    embs = np.asarray(embs, dtype=np.float32)
+    norms = np.linalg.norm(embs, axis=1, keepdims=True)
+    return embs / np.maximum(norms, 1e-12)
+
+
+def is_unit_norm(embs: np.ndarray, sample_size: int = 256, atol: float = 1e-3) -> bool:
+    """
+    고르게 뽑은 sample_size개 행의 L2 norm이 모두 1에 가까운지 (이미 정규화된 임베딩인지 확인).
+    memory-map 배열도 표본 행만 읽습니다.
+    """
+    if len(embs) == 0:
+        return True
+    rows = np.unique(np.linspace(0, len(embs) - 1, num=min(sample_size, len(embs))).astype(np.int64))
+    norms = np.linalg.norm(np.asarray(embs[rows], dtype=np.float32), axis=1)
+    return bool(np.all(np.abs(norms - 1.0) <= atol))
+
+
+def top_k_rows(sims: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    각 행에서 점수가 높은 k개의 (index, score)를 내림차순으로 반환.
+    전체 정렬 대신 argpartition으로 후보 k개만 고른 뒤 그 안에서만 정렬합니다.
+    점수가 같으면 index가 작은 쪽이 앞에 옵니다.
+    """
+    n = sims.shape[1]
+    k = min(k, n)
+    if k < n:
+        part = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(n), sims.shape).copy()
+    part.sort(axis=1)  # 동점일 때 index 순서를 유지하기 위해 먼저 index 정렬
+    part_scores = np.take_along_axis(sims, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+
+def top_k_similar(
+    query_embs: np.ndarray,
+    misconception_embs: np.ndarray,
+    k: int = 25,
+    chunk_size: int = 1024,
+    normalize: bool = True
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    질의마다 cosine similarity 상위 k개 misconception의 (index, score)를 반환.
+    질의를 chunk_size씩 나눠 (chunk_size × misconception 수) 크기의 유사도 행렬만 메모리에 둡니다.
+    """
+    if normalize:
+        query_embs = l2_normalize(query_embs)
+        misconception_embs = l2_normalize(misconception_embs)
+    indices, scores = [], []
+    for start in range(0, len(query_embs), chunk_size):
+        sims = query_embs[start:start + chunk_size] @ misconception_embs.T
+        chunk_indices, chunk_scores = top_k_rows(sims, k)
+        indices.append(chunk_indices)
+        scores.append(chunk_scores)
+    if not indices:
+        return np.empty((0, k), dtype=np.int64), np.empty((0, k), dtype=np.float32)
+    return np.concatenate(indices), np.concatenate(scores)
+
+
+FUSION_METHODS = ("rank_power", "rrf")
+
+
+def _rank_cost(ranks: np.ndarray, method: str, power: float, rrf_k: int) -> np.ndarray:
+    """
+    0부터 시작하는 순위를 모델 하나의 점수로 변환 (낮을수록 상위).
+    rank_power: rank ** power, rrf: -1 / (rrf_k + rank + 1)
+    """
+    ranks = ranks.astype(np.float64)
+    if method == "rrf":
+        return -1.0 / (rrf_k + ranks + 1.0)
+    return ranks ** power
+
+
+def _full_ranks(sims: np.ndarray) -> np.ndarray:
+    """행마다 유사도 내림차순 순위 (np.argsort(np.argsort(-sims), kind="stable")와 같음)"""
+    order = np.argsort(-sims, axis=1, kind="stable")
+    ranks = np.empty(order.shape, dtype=np.int64)
+    np.put_along_axis(ranks, order, np.arange(sims.shape[1]), axis=1)
+    return ranks
+
+
+def _fuse_full(
+    query_chunks: List[np.ndarray],
+    misconception_embs_list: Sequence[np.ndarray],
+    weights: np.ndarray,
+    k: int,
+    method: str,
+    power: float,
+    rrf_k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    질의 chunk 하나에 대해 모델별 전체 순위를 하나씩 계산해 가중 점수를 누적 (정확한 앙상블).
+    메모리에는 (chunk 크기 × misconception 수) 누적 행렬과 현재 모델의 순위만 둡니다.
+    """
+    total = None
+    for q, m, weight in zip(query_chunks, misconception_embs_list, weights):
+        cost = _rank_cost(_full_ranks(q @ m.T), method, power, rrf_k)
+        if total is None:
+            total = weight * cost
+        else:
+            total += weight * cost
+    return top_k_rows(-total, k)
+
+
+def _fuse_candidates(
+    per_model_indices: List[np.ndarray],
+    num_items: int,
+    candidate_k: int,
+    k: int,
+    power: float,
+    weights: Optional[np.ndarray] = None,
+    method: str = "rank_power",
+    rrf_k: int = 60
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    모델별 상위 candidate_k 후보(순위순)의 합집합에서 가중 순위 점수를 계산해 상위 k개 반환 (낮을수록 상위).
+    어떤 모델의 후보에 없는 항목은 그 모델에서의 순위를 candidate_k로 둡니다 (실제 순위의 하한).
+    weights는 합이 1인 모델별 가중치 (None이면 균등).
+    """
+    num_models = len(per_model_indices)
+    if weights is None:
+        weights = np.full(num_models, 1.0 / num_models)
+    candidates = np.concatenate(per_model_indices, axis=1)  # (B, M*C)
+
+    # 후보를 index 순으로 정렬해 중복 제거 및 동점 시 index 순서 보장
+    candidates = np.sort(candidates, axis=1)
+    duplicate = np.zeros(candidates.shape, dtype=bool)
+    duplicate[:, 1:] = candidates[:, 1:] == candidates[:, :-1]
+    # 근사 검색에서 후보가 모자라 채워진 -1은 제외
+    duplicate |= candidates < 0
+
+    # 행마다 index에 row * num_items를 더해 전체에서 유일한 key로 만든 뒤 searchsorted로 순위 조회
+    row_offset = np.arange(len(candidates), dtype=np.int64)[:, None] * num_items
+    candidate_keys = (candidates + row_offset).ravel()
+    scores = np.zeros(candidates.shape, dtype=np.float64)
+    for model_indices, weight in zip(per_model_indices, weights):
+        model_keys = np.where(model_indices < 0, -1, model_indices + row_offset).ravel()
+        order = np.argsort(model_keys)
+        sorted_keys = model_keys[order]
+        positions = np.tile(np.arange(model_indices.shape[1]), len(model_indices))[order]
+        found_at = np.minimum(np.searchsorted(sorted_keys, candidate_keys), len(sorted_keys) - 1)
+        found = sorted_keys[found_at] == candidate_keys
+        rank = np.where(found, positions[found_at], candidate_k).reshape(candidates.shape)
+        scores += weight * _rank_cost(rank, method, power, rrf_k)
+    scores[duplicate] = np.inf
+
+    k = min(k, candidates.shape[1])
+    order = np.argsort(scores, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+def rank_ensemble_top_k(
+    query_embs: Union[np.ndarray, Sequence[np.ndarray]],
+    misconception_embs_list: Sequence[np.ndarray],
+    k: int = 25,
+    candidate_k: Optional[int] = None,
+    power: float = 1 / 4,
+    chunk_size: int = 1024,
+    normalize: bool = True,
+    indexes: Optional[Sequence] = None,
+    weights: Optional[Sequence[float]] = None,
+    method: str = "rank_power",
+    rrf_k: int = 60,
+    exact: bool = False
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    여러 임베딩 모델의 순위를 합쳐 상위 k개 misconception을 반환.
+    (모델, 질의, misconception) 3차원 순위 배열은 만들지 않고 질의 chunk마다 모델 하나씩 점수를 누적합니다.
+
+    method: "rank_power"면 가중 평균 rank ** power (기존 np.mean(rank ** (1/4)) 앙상블과 같은 점수, 낮을수록 상위),
+            "rrf"면 reciprocal rank fusion 가중 평균 1 / (rrf_k + rank + 1) (높을수록 상위)
+    weights: 모델별 가중치 (None이면 균등, 합이 1이 되도록 정규화)
+    exact: True면 모델마다 전체 순위를 계산해 누적 (indexes는 사용하지 않음, 원래 앙상블과 같은 결과)
+
+    query_embs: 모든 모델에 공통인 질의 임베딩 하나, 또는 모델별 질의 임베딩 목록
+    candidate_k: 모델별로 순위를 계산할 후보 수 (기본 4k). 모델이 하나면 결과는 전체 정렬과 같고,
+                 여러 모델일 때는 후보 밖 순위를 candidate_k로 근사하므로 값을 키울수록 정확해집니다.
+    indexes: 모델별 근사 검색 인덱스 (ann_index.IVFIndex 등, search(queries, k) 제공) 목록.
+             None이거나 원소가 None인 모델은 전체(exact) 검색을 사용합니다.
+    normalize: False면 질의와 misconception 임베딩이 이미 L2 정규화되어 있다고 보고 그대로 사용
+               (매 호출마다 float 행렬을 다시 정규화하지 않도록 로드 시 한 번 정규화해 두는 경우)
+    """
+    num_models = len(misconception_embs_list)
+    indexes = list(indexes) if indexes is not None else [None] * num_models
+    if len(indexes) != num_models:
+        raise ValueError("모델별 인덱스 수와 misconception 임베딩 수가 다릅니다.")
+    if isinstance(query_embs, np.ndarray) and query_embs.ndim == 2:
+        query_embs_list = [query_embs] * num_models
+    else:
+        query_embs_list = list(query_embs)
+    if len(query_embs_list) != num_models:
+        raise ValueError("모델별 질의 임베딩 수와 misconception 임베딩 수가 다릅니다.")
+    if num_models == 0:
+        raise ValueError("misconception 임베딩이 하나 이상 필요합니다.")
+    if method not in FUSION_METHODS:
+        raise ValueError(f"지원하지 않는 앙상블 방식입니다: {method} (가능: {FUSION_METHODS})")
+    weights = np.ones(num_models) if weights is None else np.asarray(weights, dtype=np.float64)
+    if len(weights) != num_models or np.any(weights < 0) or weights.sum() <= 0:
+        raise ValueError("모델별 가중치는 모델 수만큼의 0 이상 값이어야 하며 합이 0보다 커야 합니다.")
+    weights = weights / weights.sum()
+
+    candidate_k = max(k, candidate_k or 4 * k)
+    if normalize:
+        # 같은 배열을 공유하는 앙상블 멤버는 한 번만 정규화
+        normalized = {}
+
+        def normalize_once(embs):
+            if id(embs) not in normalized:
+                normalized[id(embs)] = l2_normalize(embs)
+            return normalized[id(embs)]
+
+        # 인덱스로 검색하는 모델의 float 행렬은 (exact가 아니면) 쓰지 않으므로 정규화 복사본을 만들지 않음
+        misconception_embs_list = [
+            embs if index is not None and not exact else normalize_once(embs)
+            for embs, index in zip(misconception_embs_list, indexes)
+        ]
+        query_embs_list = [normalize_once(embs) for embs in query_embs_list]
+
+    num_queries = len(query_embs_list[0])
+    num_items = max(len(m) for m in misconception_embs_list)
+    indices, scores = [], []
+    for start in range(0, num_queries, chunk_size):
+        if exact:
+            chunk_indices, chunk_scores = _fuse_full(
+                [q[start:start + chunk_size] for q in query_embs_list],
+                misconception_embs_list, weights, k, method, power, rrf_k
+            )
+            indices.append(chunk_indices)
+            scores.append(-chunk_scores)
+            continue
+        per_model_indices = [
+            index.search(q[start:start + chunk_size], candidate_k)[0] if index is not None
+            else top_k_similar(q[start:start + chunk_size], m, candidate_k, chunk_size, normalize=False)[0]
+            for q, m, index in zip(query_embs_list, misconception_embs_list, indexes)
+        ]
+        chunk_indices, chunk_scores = _fuse_candidates(
+            per_model_indices, num_items, candidate_k, k, power, weights, method, rrf_k
+        )
+        indices.append(chunk_indices)
+        scores.append(chunk_scores)
+    if not indices:
+        return np.empty((0, k), dtype=np.int64), np.empty((0, k), dtype=np.float64)
+    scores = np.concatenate(scores)
+    # rrf는 내부적으로 부호를 뒤집어 낮을수록 상위로 계산했으므로 원래 점수(높을수록 상위)로 되돌림
+    return np.concatenate(indices), -scores if method == "rrf" else scores
@@ -0,0 +1,183 @@
+# retriever.py
+# 임베딩 앙상블 기반 misconception 검색기 (모델/임베딩은 처음 사용할 때 로드)
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.misconception_catalog import load_catalog
+from src.FisrtModule.ann_index import load_or_build_index
+from src.FisrtModule.embedding_cache import QueryEmbeddingCache
+from src.FisrtModule.embedding_store import MisconceptionEmbeddingStore
+from src.FisrtModule.preprocessing import ANCHOR_PROMPT, build_anchors, preprocess, wide_to_long
+from src.FisrtModule.quantization import QuantizedIndex
+from src.FisrtModule.retrieval import is_unit_norm, l2_normalize, rank_ensemble_top_k
+
+logger = logging.getLogger(__name__)
+
+base_path = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODELS = {"minsuas/Misconceptions__1": os.path.join(base_path, "embs_misconception-9-9.npy")}
+DEFAULT_MISCONCEPTION_CSV = os.path.join(os.path.dirname(os.path.dirname(base_path)), "Data", "misconception_mapping.csv")
+
+
+@dataclass
+class RetrievalResult:
+    query_ids: List[str]              # QuestionId_Answer
+    anchors: List[str]                # 검색에 사용한 anchor 프롬프트
+    misconception_ids: np.ndarray     # (n, k) MisconceptionId, 순위순 (근사 검색 후보가 모자란 자리는 -1)
+    scores: np.ndarray                # (n, k) 앙상블 점수 (rank_power: 낮을수록 상위, rrf: 높을수록 상위)
+
+
+class MisconceptionRetriever:
+    """
+    오답 보기마다 관련 misconception 상위 k개를 찾는 검색기.
+
+    models: {SentenceTransformer 모델 이름: misconception 임베딩 .npy 경로}
+            (임베딩 행 순서는 misconception_mapping.csv 행 순서와 같아야 함)
+    weights / fusion / exact_fusion: rank_ensemble_top_k의 weights / method / exact (모델별 가중치와 앙상블 방식)
+    quantization: "int8" / "float16"이면 양자화 임베딩으로 후보를 고른 뒤 float 임베딩으로 재정렬 (None이면 float 전체 검색)
+    ann: True면 모델마다 IVF 근사 검색 인덱스(ann_index.IVFIndex)로 후보를 고름 (n_probe개 군집만 탐색).
+         인덱스는 ann_index_dir(기본: 임베딩 파일 폴더)에 한 번 만들어 재사용. False면 전체(exact) 검색
+    import나 생성만으로는 아무것도 로드하지 않고, 첫 predict 호출 시 모델과 임베딩을 불러옵니다.
+    """
+
+    def __init__(
+        self,
+        models: Optional[Dict[str, str]] = None,
+        misconception_csv_path: str = DEFAULT_MISCONCEPTION_CSV,
+        cache_dir: Optional[str] = None,
+        candidate_k: Optional[int] = None,
+        hf_token: Optional[str] = None,
+        quantization: Optional[str] = None,
+        weights: Optional[List[float]] = None,
+        fusion: str = "rank_power",
+        exact_fusion: bool = False,
+        ann: bool = False,
+        n_probe: int = 8,
+        ann_index_dir: Optional[str] = None,
+    ):
+        if ann and quantization:
+            raise ValueError("ann과 quantization은 함께 사용할 수 없습니다.")
+        self.model_paths = dict(models or DEFAULT_MODELS)
+        self.misconception_csv_path = misconception_csv_path
+        self.cache_dir = cache_dir
+        self.candidate_k = candidate_k
+        self.hf_token = hf_token or os.getenv("HF_TOKEN")
+        self.quantization = quantization
+        self.weights = weights
+        self.fusion = fusion
+        self.exact_fusion = exact_fusion
+        self.ann = ann
+        self.n_probe = n_probe
+        self.ann_index_dir = ann_index_dir
+        self._models = None
+        self._caches = None
+        self._embeddings = None
+        self._indexes = None
+        self._lock = threading.Lock()
+
+    @property
+    def catalog(self):
+        return load_catalog(self.misconception_csv_path)
+
+    def _load(self):
+        with self._lock:
+            if self._models is not None:
+                return
+            # sentence_transformers는 무거우므로 실제로 필요할 때만 import
+            from sentence_transformers import SentenceTransformer
+            if self.hf_token:
+                from huggingface_hub import login
+                login(token=self.hf_token)
+
+            store = MisconceptionEmbeddingStore(self.model_paths, expected_rows=len(self.catalog))
+            self._embeddings = [store.get(name) for name in self.model_paths]
+            if self.quantization:
+                self._indexes = [QuantizedIndex(embs, dtype=self.quantization) for embs in self._embeddings]
+            elif self.ann:
+                self._indexes = [
+                    load_or_build_index(path, embs, self.ann_index_dir, n_probe=self.n_probe)
+                    for path, embs in zip(self.model_paths.values(), self._embeddings)
+                ]
+            if self._indexes is None or self.exact_fusion:
+                # float 행렬로 검색할 때는 로드 시 한 번만 정규화 (검색마다 다시 정규화하지 않음).
+                # 저장된 임베딩이 이미 단위 벡터면 memory-map을 그대로 써서 worker 프로세스끼리 page cache를 공유
+                # (정규화 복사본을 만들면 프로세스마다 private 메모리를 씀).
+                # 인덱스만 쓰면 인덱스가 자체 벡터/후보 행만 읽으므로 정규화할 필요가 없음
+                self._embeddings = [
+                    embs if is_unit_norm(embs) else l2_normalize(embs) for embs in self._embeddings
+                ]
+            models = []
+            for name in self.model_paths:
+                logger.info(f"Loading retrieval model '{name}'...")
+                models.append(SentenceTransformer(name))
+            self._caches = [
+                QueryEmbeddingCache(self.cache_dir, name, normalize=True) if self.cache_dir else None
+                for name in self.model_paths
+            ]
+            self._models = models
+
+    def _encode(self, anchors: List[str]) -> List[np.ndarray]:
+        query_embs = []
+        for model, cache in zip(self._models, self._caches):
+            if cache is not None:
+                query_embs.append(cache.encode(model, anchors))
+            else:
+                query_embs.append(model.encode(anchors, normalize_embeddings=True))
+        return query_embs
+
+    def search_anchors(self, anchors: List[str], k: int = 25) -> Tuple[np.ndarray, np.ndarray]:
+        """anchor 텍스트 목록에 대해 (MisconceptionId (n, k), score (n, k)) 반환"""
+        self._load()
+        if not anchors:
+            return np.empty((0, k), dtype=np.int64), np.empty((0, k), dtype=np.float64)
+        positions, scores = rank_ensemble_top_k(
+            self._encode(list(anchors)),
+            self._embeddings,
+            k=k,
+            candidate_k=self.candidate_k,
+            indexes=self._indexes,
+            weights=self.weights,
+            method=self.fusion,
+            exact=self.exact_fusion,
+            normalize=False,  # 질의는 encode에서, misconception 임베딩은 _load에서 정규화
+        )
+        # 임베딩 행 번호 → MisconceptionId. 근사 검색 후보가 k개보다 적어 -1로 채워진 자리는
+        # catalog.ids[-1](마지막 misconception)로 바뀌지 않도록 -1로 남김
+        valid = positions >= 0
+        misconception_ids = np.where(valid, self.catalog.ids[np.where(valid, positions, 0)], -1)
+        return misconception_ids, scores
+
+    def predict(self, rows: pd.DataFrame, k: int = 25) -> RetrievalResult:
+        """
+        train.csv/test.csv 형식(문제당 한 행)의 rows에 대해 오답 보기마다 상위 k개 misconception을 예측
+        """
+        df_long = wide_to_long(preprocess(rows))
+        anchors = build_anchors(df_long).tolist()
+        misconception_ids, scores = self.search_anchors(anchors, k=k)
+        return RetrievalResult(df_long["QuestionId_Answer"].tolist(), anchors, misconception_ids, scores)
+
+    def predict_misconception(self,
+                              construct_name: str,
+                              subject_name: str,
+                              question_text: str,
+                              correct_answer_text: str,
+                              wrong_answer_text: str,
+                              wrong_answer: str,
+                              row) -> (int, str):
+        """MisconceptionPredictor.predict_misconception과 같은 형식으로 상위 1개 (id, text) 반환"""
+        anchor = ANCHOR_PROMPT.format(
+            SubjectName=str(subject_name).strip(),
+            ConstructName=str(construct_name).strip(),
+            QuestionText=str(question_text).strip(),
+            AnswerText=str(wrong_answer_text).strip().replace("Only\n", "Only ")
+        )
+        misconception_ids, _ = self.search_anchors([anchor], k=1)
+        misconception_id = int(misconception_ids[0, 0])
+        if misconception_id < 0:
+            return -1, "There is no misconception"
+        return misconception_id, self.catalog.get(misconception_id, "There is no misconception")
@@ -1,10 +1,15 @@
+import asyncio
 import pandas as pd
 import requests
-from typing import Tuple, Optional
+from typing import Callable, Iterator, List, Tuple, Optional, Union
 from dataclasses import dataclass
 import logging
 from dotenv import load_dotenv
 import os
+from src.misconception_catalog import load_catalog
+from src.response_cache import ResponseCache
+from src.llm_backend import LLMBackend, get_llm_backend
+from src.SecondModule.output_parser import STOP_SEQUENCES, IncrementalQuestionParser, estimate_max_new_tokens
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -13,16 +18,14 @@ logger = logging.getLogger(__name__)
 # .env 파일 로드
 load_dotenv()
 
-# Hugging Face API 정보
-API_URL = "https://api-inference.huggingface.co/models/meta-llama/Meta-Llama-3-8B-Instruct"
-API_KEY = os.getenv("HUGGINGFACE_API_KEY")
+# LLM 응답 캐시 (선택). LLM_CACHE_PATH가 설정된 경우에만 사용
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "0")) or None  # 초 단위, 0이면 만료 없음
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "0")) or None
 
 base_path = os.path.dirname(os.path.abspath(__file__))
 misconception_csv_path = os.path.join(base_path, 'misconception_mapping.csv')
 
-if not API_KEY:
-    raise ValueError("API_KEY가 설정되지 않았습니다. .env 파일을 확인하세요.")
-
 #유사 문제 생성기 클래스
 
 @dataclass
@@ -33,15 +36,23 @@ class GeneratedQuestion:
     explanation: str
 
 class SimilarQuestionGenerator:
-    def __init__(self, misconception_csv_path: str = 'misconception_mapping.csv'):
+    def __init__(self, misconception_csv_path: str = 'misconception_mapping.csv', response_cache: Optional[ResponseCache] = None, backend: Optional[LLMBackend] = None):
         """
         Initialize the generator by loading the misconception mapping and the language model.
+        backend가 주어지지 않으면 LLM_BACKEND 환경 변수로 고른 공용 backend(기본: HF Inference API)를 사용합니다.
+        response_cache가 주어지지 않으면 LLM_CACHE_PATH 환경 변수로 캐시를 엽니다 (없으면 캐시 미사용).
+        generation_params에 넣은 값은 build_generation_params의 기본값(max_new_tokens, stop 등)보다 우선합니다.
         """
         self._load_data(misconception_csv_path)
+        self.generation_params = {}
+        self.backend = backend or get_llm_backend()
+        if response_cache is None and LLM_CACHE_PATH:
+            response_cache = ResponseCache(LLM_CACHE_PATH, ttl_seconds=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES)
+        self.response_cache = response_cache
 
     def _load_data(self, misconception_csv_path: str):
         logger.info("Loading misconception mapping...")
-        self.misconception_df = pd.read_csv(misconception_csv_path)
+        self.catalog = load_catalog(misconception_csv_path)
 
     def get_misconception_text(self, misconception_id: float) -> Optional[str]:
         # MisconceptionId를 받아 해당 ID에 매칭되는 오개념 설명 텍스트를 반환합니다
@@ -50,13 +61,10 @@ class SimilarQuestionGenerator:
             logger.warning("Received NaN for misconception_id.")
             return "No misconception provided."
         
-        try:
-            row = self.misconception_df[self.misconception_df['MisconceptionId'] == int(misconception_id)]
-            if not row.empty:
-                return row.iloc[0]['MisconceptionName']
-        except ValueError as e:
-            logger.error(f"Error processing misconception_id: {e}")
-        
+        misconception_text = self.catalog.get(misconception_id)
+        if misconception_text is not None:
+            return misconception_text
+
         logger.warning(f"No misconception found for ID: {misconception_id}")
         return "Misconception not found."
 
@@ -96,31 +104,49 @@ class SimilarQuestionGenerator:
         logger.debug(f"Generated prompt: {prompt}")
         return prompt
 
-    def call_model_api(self, prompt: str) -> str:
-        """Hugging Face API 호출"""
-        logger.info("Calling Hugging Face API...")
-        headers = {"Authorization": f"Bearer {API_KEY}"}
-        
+    def build_generation_params(self, question_text: str, *answer_texts: str) -> dict:
+        """
+        출력 형식에 맞춘 생성 파라미터: 원래 문제/보기 길이로 추정한 max_new_tokens, stop sequence,
+        그리고 프롬프트를 응답에 다시 붙이지 않도록 return_full_text=False
+        """
+        return {
+            "max_new_tokens": estimate_max_new_tokens(question_text, *answer_texts),
+            "stop": STOP_SEQUENCES,
+            "return_full_text": False,
+            **self.generation_params,
+        }
+
+    @staticmethod
+    def _is_complete_output(text: str) -> bool:
+        """
+        문제/보기/정답/해설 줄이 모두 줄바꿈으로 끝났는지 (잘린 출력은 캐시하지 않음).
+        finish()는 부르지 않음: 마지막 줄을 닫으면 max_new_tokens에서 잘린 해설도 완성된 것처럼 보이기 때문
+        """
+        parser = IncrementalQuestionParser()
+        parser.feed(text)
+        return parser.is_complete
+
+    def call_model_api(self, prompt: str, params: Optional[dict] = None, refresh: bool = False) -> str:
+        """
+        LLM backend 호출 (응답 캐시가 있으면 먼저 조회). params가 없으면 generation_params 사용.
+        refresh=True면 캐시를 조회하지 않고 새로 생성해 캐시 항목을 덮어씀 (새 문제 요청, 검증 불일치 후 재생성)
+        """
+        params = self.generation_params if params is None else params
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = ResponseCache.make_key(self.backend.model_id, prompt, params)
+            cached_text = None if refresh else self.response_cache.get(cache_key)
+            if cached_text is not None:
+                logger.info(f"Response cache hit: {self.response_cache.stats()}")
+                return cached_text
+
+        logger.info(f"Calling LLM backend '{self.backend.name}'...")
         try:
-            response = requests.post(API_URL, headers=headers, json={"inputs": prompt})
-            response.raise_for_status()
-            
-            response_data = response.json()
-            logger.debug(f"Raw API response: {response_data}")
-            
-            # API 응답이 리스트인 경우 처리
-            if isinstance(response_data, list):
-                if response_data and isinstance(response_data[0], dict):
-                    generated_text = response_data[0].get('generated_text', '')
-                else:
-                    generated_text = response_data[0] if response_data else ''
-            # API 응답이 딕셔너리인 경우 처리
-            elif isinstance(response_data, dict):
-                generated_text = response_data.get('generated_text', '')
-            else:
-                generated_text = str(response_data)
+            generated_text = self.backend.generate(prompt, params)
                 
             logger.info(f"Generated text: {generated_text}")
+            if cache_key is not None and generated_text and self._is_complete_output(generated_text):
+                self.response_cache.set(cache_key, self.backend.model_id, generated_text)
             return generated_text
             
         except requests.exceptions.RequestException as e:
@@ -129,38 +155,70 @@ class SimilarQuestionGenerator:
         except Exception as e:
             logger.error(f"Unexpected error in call_model_api: {e}")
             raise
+
+    def stream_model_api(self, prompt: str, params: Optional[dict] = None, refresh: bool = False) -> Iterator[str]:
+        """
+        LLM backend를 스트리밍 모드로 호출해 생성되는 텍스트 조각을 순서대로 yield.
+        문제/보기/정답/해설이 모두 파싱되면 남은 생성(닫는 "---", 잡담)은 기다리지 않고 연결을 끊습니다.
+        응답 캐시에 있으면 캐시된 전체 텍스트를 한 번에 yield하고 (refresh=True면 조회하지 않음),
+        해설 줄까지 줄바꿈으로 끝난 경우에만 캐시에 저장합니다 (max_new_tokens에서 잘린 출력은 저장하지 않음).
+        """
+        params = self.generation_params if params is None else params
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = ResponseCache.make_key(self.backend.model_id, prompt, params)
+            cached_text = None if refresh else self.response_cache.get(cache_key)
+            if cached_text is not None:
+                logger.info(f"Response cache hit: {self.response_cache.stats()}")
+                yield cached_text
+                return
+
+        logger.info(f"Calling LLM backend '{self.backend.name}' (streaming)...")
+        parser = IncrementalQuestionParser()
+        chunks = []
+        stream = self.backend.stream(prompt, params)
+        try:
+            for chunk in stream:
+                chunks.append(chunk)
+                yield chunk
+                parser.feed(chunk)
+                if parser.is_complete:
+                    logger.info("All question fields received; stopping generation stream early")
+                    break
+        finally:
+            # 연결을 닫아 서버 쪽 생성도 중단되도록 함
+            stream.close()
+        generated_text = "".join(chunks)
+        logger.info(f"Generated text: {generated_text}")
+        # 줄바꿈 전에 끊긴 마지막 줄은 파싱하지 않은 상태로 판단 (finish() 호출 전)
+        if cache_key is not None and parser.is_complete:
+            self.response_cache.set(cache_key, self.backend.model_id, generated_text)
+
     def parse_model_output(self, output: str) -> GeneratedQuestion:
         if not isinstance(output, str):
             logger.error(f"Invalid output format: {type(output)}. Expected string.")
             raise ValueError("Model output is not a string.")
 
         logger.info(f"Parsing output: {output}")
-        output_lines = output.strip().splitlines()
-        logger.debug(f"Split output into lines: {output_lines}")
-
-        question, choices, correct_answer, explanation = "", {}, "", ""
-
-        for line in output_lines:
-            if line.lower().startswith("question:"):
-                question = line.split(":", 1)[1].strip()
-            elif line.startswith("A)"):
-                choices["A"] = line[2:].strip()
-            elif line.startswith("B)"):
-                choices["B"] = line[2:].strip()
-            elif line.startswith("C)"):
-                choices["C"] = line[2:].strip()
-            elif line.startswith("D)"):
-                choices["D"] = line[2:].strip()
-            elif line.lower().startswith("correct answer:"):
-                correct_answer = line.split(":", 1)[1].strip()
-            elif line.lower().startswith("explanation:"):
-                explanation = line.split(":", 1)[1].strip()
+        parser = IncrementalQuestionParser()
+        parser.feed(output.strip())
+        parser.finish()
+
+        question = parser.fields.get("question", "")
+        choices = parser.choices
+        correct_answer = parser.fields.get("correct_answer", "")
+        explanation = parser.fields.get("explanation", "")
 
         if not question or len(choices) < 4 or not correct_answer or not explanation:
             logger.warning("Incomplete generated question.")
         return GeneratedQuestion(question, choices, correct_answer, explanation)
 
-    def generate_similar_question_with_text(self, construct_name: str, subject_name: str, question_text: str, correct_answer_text: str, wrong_answer_text: str, misconception_id: float) -> Tuple[Optional[GeneratedQuestion], Optional[str]]:
+    def generate_similar_question_with_text(self, construct_name: str, subject_name: str, question_text: str, correct_answer_text: str, wrong_answer_text: str, misconception_id: float, on_field: Optional[Callable[[str, str], None]] = None, refresh: bool = False) -> Tuple[Optional[GeneratedQuestion], Optional[str]]:
+        """
+        on_field가 주어지면 스트리밍으로 생성하면서, 문제/보기/정답/해설 줄이 완성될 때마다 on_field(필드, 값)을 호출합니다.
+        (필드: output_parser.QUESTION_FIELDS)
+        refresh=True면 응답 캐시를 건너뛰고 새로 생성합니다 (같은 입력으로 다른 문제가 필요할 때).
+        """
         logger.info("generate_similar_question_with_text initiated")
 
         # 예외 처리 추가
@@ -176,12 +234,16 @@ class SimilarQuestionGenerator:
             return None, None
 
         prompt = self.generate_prompt(construct_name, subject_name, question_text, correct_answer_text, wrong_answer_text, misconception_text)
+        params = self.build_generation_params(question_text, correct_answer_text, wrong_answer_text)
         logger.info(f"Generated prompt: {prompt}")
 
         generated_text = None  # 기본값으로 초기화
         try:
-            logger.info("Calling call_model_api...")
-            generated_text = self.call_model_api(prompt)
+            if on_field is None:
+                logger.info("Calling call_model_api...")
+                generated_text = self.call_model_api(prompt, params, refresh=refresh)
+            else:
+                generated_text = self._stream_with_callback(prompt, on_field, params, refresh=refresh)
             logger.info(f"Generated text from API: {generated_text}")
 
             # 파싱
@@ -194,3 +256,35 @@ class SimilarQuestionGenerator:
             logger.debug(f"API output for debugging: {generated_text}")
             return None, generated_text
 
+    def _stream_with_callback(self, prompt: str, on_field: Callable[[str, str], None], params: Optional[dict] = None, refresh: bool = False) -> str:
+        """스트리밍 생성 텍스트를 모으면서 완성된 줄을 파싱해 on_field로 전달하고, 전체 텍스트를 반환"""
+        parser = IncrementalQuestionParser()
+        chunks = []
+        for chunk in self.stream_model_api(prompt, params, refresh=refresh):
+            chunks.append(chunk)
+            for field, value in parser.feed(chunk):
+                on_field(field, value)
+        for field, value in parser.finish():
+            on_field(field, value)
+        return "".join(chunks)
+
+    async def agenerate_many(self, items: List[dict], concurrency: int = 4) -> List[Union[Tuple[Optional[GeneratedQuestion], Optional[str]], Exception]]:
+        """
+        여러 문제에 대해 유사 문제를 동시에 생성 (최대 concurrency개 동시 호출).
+        items의 각 원소는 generate_similar_question_with_text의 키워드 인자 dict.
+        결과는 입력 순서대로 (GeneratedQuestion, raw_output) 튜플이며,
+        처리 중 예외가 발생한 항목은 해당 예외 객체가 그 자리에 들어갑니다.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def run(item: dict):
+            async with semaphore:
+                # HTTP 호출은 동기 클라이언트를 쓰므로 스레드에서 실행
+                return await asyncio.to_thread(self.generate_similar_question_with_text, **item)
+
+        logger.info(f"Generating {len(items)} similar questions (concurrency={concurrency})")
+        return await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
+
+    def generate_many(self, items: List[dict], concurrency: int = 4) -> List[Union[Tuple[Optional[GeneratedQuestion], Optional[str]], Exception]]:
+        """agenerate_many의 동기 버전 (이벤트 루프가 실행 중이지 않은 곳에서 호출)"""
+        return asyncio.run(self.agenerate_many(items, concurrency=concurrency))
@@ -1,11 +1,14 @@
 # module2.py
 import pandas as pd
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
-from typing import Tuple, Optional
+from threading import Thread
+from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+from typing import Callable, Tuple, Optional
 from dataclasses import dataclass
 import logging
-from config import Llama3_8b_PATH
+from src.config import Llama3_8b_PATH
+from src.model_registry import load_shared_model
+from src.SecondModule.output_parser import STOP_SEQUENCES, IncrementalQuestionParser, estimate_max_new_tokens
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -18,6 +21,33 @@ class GeneratedQuestion:
     correct_answer: str
     explanation: str
 
+class QuestionCompleteCriteria(StoppingCriteria):
+    """
+    생성된 부분에 stop sequence가 나오거나 문제/보기/정답/해설이 모두 파싱되면 생성을 멈춤.
+    매 토큰마다 전체를 다시 decode/파싱하지 않고, 새로 생성된 토큰만 decode해 IncrementalQuestionParser에 넣습니다.
+    (생성 한 번마다 새 인스턴스를 써야 함)
+    """
+
+    def __init__(self, tokenizer, prompt_length: int):
+        self.tokenizer = tokenizer
+        self.parser = IncrementalQuestionParser()
+        self._decoded_upto = prompt_length   # 여기까지의 토큰은 parser에 넣음
+        self._tail = ""                      # 토큰 경계에 걸친 stop sequence 확인용
+        self._tail_length = max(len(stop) for stop in STOP_SEQUENCES)
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        text = self.tokenizer.decode(input_ids[0, self._decoded_upto:], skip_special_tokens=False)
+        done = False
+        # 여러 토큰에 걸친 UTF-8 문자가 아직 덜 생성되었으면 다음 토큰과 함께 decode
+        if text and not text.endswith("\ufffd"):
+            self._decoded_upto = input_ids.shape[1]
+            window = self._tail + text
+            done = any(stop in window for stop in STOP_SEQUENCES)
+            self._tail = window[-self._tail_length:]
+            self.parser.feed(text)
+            done = done or self.parser.is_complete
+        return torch.full((input_ids.shape[0],), done, dtype=torch.bool, device=input_ids.device)
+
 class SimilarQuestionGenerator:
     def __init__(self, misconception_csv_path: str = 'misconception_mapping.csv', model_name: str = 'meta-llama/Meta-Llama-3-8B-Instruct'):
         """
@@ -32,22 +62,8 @@ class SimilarQuestionGenerator:
         self.misconception_df = pd.read_csv(misconception_csv_path)
 
     def _load_model(self, model_name: str):
-        """Load the language model."""
-        logger.info(f"Loading model '{model_name}' from '{Llama3_8b_PATH}'...")
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name, cache_dir=Llama3_8b_PATH, trust_remote_code=True)
-        self.model = AutoModelForCausalLM.from_pretrained(
-            model_name,
-            cache_dir=Llama3_8b_PATH,
-            torch_dtype=torch.bfloat16 if torch.cuda.is_available() else torch.float32,
-            trust_remote_code=True,
-            device_map="auto"
-        )
-        self.model.eval()
-        if torch.cuda.is_available():
-            self.model.to('cuda')
-            logger.info("Model loaded on GPU.")
-        else:
-            logger.info("Model loaded on CPU.")
+        """Load the language model (같은 프로세스의 검증기와 같은 모델이면 공유 레지스트리에서 재사용)."""
+        self.tokenizer, self.model = load_shared_model(model_name, cache_dir=Llama3_8b_PATH)
 
     def get_misconception_text(self, misconception_id: float) -> Optional[str]:
         """Retrieve the misconception text based on the misconception ID."""
@@ -93,32 +109,63 @@ class SimilarQuestionGenerator:
 
     def parse_model_output(self, output: str) -> GeneratedQuestion:
         """Parse the model's output to extract the question details."""
-        output_lines = output.strip().splitlines()
-        question, choices, correct_answer, explanation = "", {}, "", ""
-
-        for line in output_lines:
-            line = line.strip()
-            if line.lower().startswith("question:"):
-                question = line.split(":", 1)[1].strip()
-            elif line.startswith("A)"):
-                choices["A"] = line[2:].strip()
-            elif line.startswith("B)"):
-                choices["B"] = line[2:].strip()
-            elif line.startswith("C)"):
-                choices["C"] = line[2:].strip()
-            elif line.startswith("D)"):
-                choices["D"] = line[2:].strip()
-            elif line.lower().startswith("correct answer:"):
-                correct_answer = line.split(":",1)[1].strip()
-            elif line.lower().startswith("explanation:"):
-                explanation = line.split(":",1)[1].strip()
+        parser = IncrementalQuestionParser()
+        parser.feed(output.strip())
+        parser.finish()
+
+        question = parser.fields.get("question", "")
+        choices = parser.choices
+        correct_answer = parser.fields.get("correct_answer", "")
+        explanation = parser.fields.get("explanation", "")
 
         if not question or len(choices) < 4 or not correct_answer or not explanation:
             logger.warning("Incomplete generated question. Some fields might be missing.")
         return GeneratedQuestion(question, choices, correct_answer, explanation)
 
-    def generate_similar_question_with_text(self, construct_name: str, subject_name: str, question_text: str, correct_answer_text: str, wrong_answer_text: str, misconception_id: float) -> Tuple[Optional[GeneratedQuestion], Optional[str]]:
-        """Generate a similar question and return the details."""
+    def _generation_kwargs(self, max_new_tokens: int, prompt_length: int) -> dict:
+        """출력 형식에 맞춘 max_new_tokens와 문제 완성 시 멈추는 stopping criteria"""
+        return dict(
+            max_new_tokens=max_new_tokens,
+            stopping_criteria=StoppingCriteriaList([QuestionCompleteCriteria(self.tokenizer, prompt_length)]),
+            num_return_sequences=1,
+            temperature=0.7,
+            top_p=0.9,
+            do_sample=True,
+            eos_token_id=self.tokenizer.eos_token_id
+        )
+
+    def _stream_generate(self, inputs: dict, generation_kwargs: dict, on_field: Callable[[str, str], None]) -> str:
+        """
+        TextIteratorStreamer로 생성 중인 텍스트를 받아, 문제/보기 줄이 완성될 때마다 on_field(필드, 값)를 호출.
+        생성은 별도 스레드에서 실행하고, 프롬프트를 제외한 assistant 텍스트 전체를 반환합니다.
+        """
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        thread = Thread(target=self._generate_no_grad, kwargs=dict(**inputs, **generation_kwargs, streamer=streamer))
+        thread.start()
+
+        parser = IncrementalQuestionParser()
+        chunks = []
+        try:
+            for chunk in streamer:
+                chunks.append(chunk)
+                for field, value in parser.feed(chunk):
+                    on_field(field, value)
+            for field, value in parser.finish():
+                on_field(field, value)
+        finally:
+            thread.join()
+        return "".join(chunks)
+
+    def _generate_no_grad(self, **kwargs):
+        with torch.no_grad():
+            return self.model.generate(**kwargs)
+
+    def generate_similar_question_with_text(self, construct_name: str, subject_name: str, question_text: str, correct_answer_text: str, wrong_answer_text: str, misconception_id: float, on_field: Optional[Callable[[str, str], None]] = None, refresh: bool = False) -> Tuple[Optional[GeneratedQuestion], Optional[str]]:
+        """
+        Generate a similar question and return the details.
+        on_field가 주어지면 스트리밍으로 생성하며 완성된 줄마다 on_field(필드, 값)를 호출합니다 (이때 반환 텍스트는 assistant 부분만).
+        refresh는 module2와 같은 인터페이스를 위한 인자로, 응답 캐시가 없고 매번 샘플링하므로 무시합니다.
+        """
         misconception_text = self.get_misconception_text(misconception_id)
         if not misconception_text:
             logger.info("Skipping question generation due to lack of misconception.")
@@ -130,16 +177,21 @@ class SimilarQuestionGenerator:
         if torch.cuda.is_available():
             inputs = {k: v.to('cuda') for k, v in inputs.items()}
 
-        with torch.no_grad():
-            outputs = self.model.generate(
-                **inputs,
-                max_length=1000,
-                num_return_sequences=1,
-                temperature=0.7,
-                top_p=0.9,
-                do_sample=True,
-                eos_token_id=self.tokenizer.eos_token_id
-            )
+        generation_kwargs = self._generation_kwargs(
+            estimate_max_new_tokens(question_text, correct_answer_text, wrong_answer_text),
+            inputs['input_ids'].shape[1]
+        )
+        if on_field is not None:
+            generated_text = self._stream_generate(inputs, generation_kwargs, on_field)
+            try:
+                generated_question = self.parse_model_output(generated_text)
+                logger.info("Successfully generated a similar question.")
+                return generated_question, generated_text
+            except Exception as e:
+                logger.error(f"Failed to parse generated question: {e}")
+                return None, generated_text
+
+        outputs = self._generate_no_grad(**inputs, **generation_kwargs)
         generated_text = self.tokenizer.decode(outputs[0], skip_special_tokens=False)
 
         assistant_start = generated_text.find("<|start_header_id|>assistant<|end_header_id|>")
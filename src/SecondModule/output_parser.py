@@ -0,0 +1,97 @@
+# output_parser.py
+# 유사 문제 생성 결과("Question: / A) ~ D) / Correct Answer: / Explanation:" 형식)를 줄 단위로 파싱
+# 스트리밍 생성 중에는 토큰 조각을 받아 줄이 완성될 때마다 필드를 내보내고, 모든 필드가 모이면 생성을 멈출 수 있게 함
+import math
+from typing import Dict, List, Optional, Tuple
+
+# 파싱 대상 필드 (출력 순서)
+QUESTION_FIELDS = ("question", "A", "B", "C", "D", "correct_answer", "explanation")
+
+# assistant 턴이 끝난 뒤의 잡담을 막는 stop sequence.
+# 출력 형식이 "---"로 시작하므로 "---"는 stop sequence로 쓸 수 없고, 닫는 "---"는 파서 완료 시점에서 끊음
+STOP_SEQUENCES = ["<|eot_id|>", "<|start_header_id|>"]
+
+# 필드별 토큰 예산 (LaTeX가 많은 수학 문제 기준 약 3글자당 1토큰으로 추정)
+CHARS_PER_TOKEN = 3
+FORMAT_OVERHEAD_TOKENS = 32      # "---", "Question:", "A)" ~ "D)", "Correct Answer:", "Explanation:" 및 줄바꿈
+CORRECT_ANSWER_TOKENS = 8
+EXPLANATION_TOKENS = 160
+
+
+def parse_line(line: str) -> Optional[Tuple[str, str]]:
+    """한 줄을 (필드 이름, 값)으로 파싱. 형식에 맞지 않는 줄이면 None"""
+    line = line.strip()
+    lowered = line.lower()
+    if lowered.startswith("question:"):
+        return "question", line.split(":", 1)[1].strip()
+    for option in ("A", "B", "C", "D"):
+        if line.startswith(f"{option})"):
+            return option, line[2:].strip()
+    if lowered.startswith("correct answer:"):
+        return "correct_answer", line.split(":", 1)[1].strip()
+    if lowered.startswith("explanation:"):
+        return "explanation", line.split(":", 1)[1].strip()
+    return None
+
+
+class IncrementalQuestionParser:
+    """
+    생성 텍스트를 조각(chunk) 단위로 받아 줄이 끝날 때마다 파싱.
+
+    feed()는 이번 조각으로 새로 완성된 (필드, 값) 목록을 반환하므로,
+    UI는 문제 본문과 보기를 줄이 완성되는 즉시 표시할 수 있습니다.
+    같은 필드가 여러 번 나오면 마지막 값을 사용합니다 (parse_model_output과 동일).
+    """
+
+    def __init__(self):
+        self.fields: Dict[str, str] = {}
+        self._buffer = ""
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split("\n")
+        return self._parse_lines(lines)
+
+    def finish(self) -> List[Tuple[str, str]]:
+        """스트림이 끝났을 때 줄바꿈 없이 남은 마지막 줄을 파싱"""
+        lines, self._buffer = [self._buffer], ""
+        return self._parse_lines(lines)
+
+    def _parse_lines(self, lines: List[str]) -> List[Tuple[str, str]]:
+        parsed = []
+        for line in lines:
+            result = parse_line(line)
+            if result is not None:
+                self.fields[result[0]] = result[1]
+                parsed.append(result)
+        return parsed
+
+    @property
+    def is_complete(self) -> bool:
+        """문제, 보기 A~D, 정답, 해설이 모두 파싱되었는지 (이후 생성되는 텍스트는 버려짐)"""
+        return all(field in self.fields for field in QUESTION_FIELDS)
+
+    @property
+    def choices(self) -> Dict[str, str]:
+        return {option: self.fields[option] for option in ("A", "B", "C", "D") if option in self.fields}
+
+
+def _token_budget(text: str, minimum: int, maximum: int) -> int:
+    # 원문보다 50% 길어지는 것까지 허용
+    estimate = math.ceil(len(str(text)) / CHARS_PER_TOKEN * 1.5)
+    return max(minimum, min(maximum, estimate))
+
+
+def estimate_max_new_tokens(question_text: str, *answer_texts: str) -> int:
+    """
+    원래 문제와 보기 길이로 유사 문제 한 개(형식 전체)에 필요한 max_new_tokens를 추정.
+    문제는 48~256, 보기는 각 16~64 토큰 범위로 잡고 정답/해설/형식 토큰을 더합니다.
+    """
+    longest_answer = max((str(text) for text in answer_texts), key=len, default="")
+    return (
+        _token_budget(question_text, 48, 256)
+        + 4 * _token_budget(longest_answer, 16, 64)
+        + CORRECT_ANSWER_TOKENS
+        + EXPLANATION_TOKENS
+        + FORMAT_OVERHEAD_TOKENS
+    )
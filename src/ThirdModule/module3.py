@@ -1,8 +1,8 @@
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
-from typing import Tuple
+from typing import Dict, List, Optional, Tuple
 import logging
-from config import Llama3_8b_PATH
+from src.config import Llama3_8b_PATH
+from src.model_registry import load_shared_model
 import re
 from collections import Counter
 
@@ -14,26 +14,8 @@ class SelfConsistencyChecker:
         self._load_model(model_name)
 
     def _load_model(self, model_name: str):
-        """Load the language model for self-consistency checking."""
-        logger.info(f"Loading model '{model_name}' from '{Llama3_8b_PATH}' for self-consistency check...")
-        self.tokenizer = AutoTokenizer.from_pretrained(
-            model_name,
-            cache_dir=Llama3_8b_PATH,
-            trust_remote_code=True
-        )
-        self.model = AutoModelForCausalLM.from_pretrained(
-            model_name,
-            cache_dir=Llama3_8b_PATH,
-            torch_dtype=torch.bfloat16 if torch.cuda.is_available() else torch.float32,
-            trust_remote_code=True,
-            device_map="auto"
-        )
-        self.model.eval()
-        if torch.cuda.is_available():
-            self.model.to('cuda')
-            logger.info("Model loaded on GPU for self-consistency.")
-        else:
-            logger.info("Model loaded on CPU for self-consistency.")
+        """Load the language model for self-consistency checking (생성기와 같은 모델이면 공유 레지스트리에서 재사용)."""
+        self.tokenizer, self.model = load_shared_model(model_name, cache_dir=Llama3_8b_PATH)
 
     def _create_prompt(self, question: str, choices: dict) -> str:
         """
@@ -93,13 +75,154 @@ class SelfConsistencyChecker:
         logger.warning(f"Failed to extract answer from text: {text}")
         return ""
 
-    def check_answer(self, question: str, choices: dict, num_inferences: int = 10) -> Tuple[str, str]:
+    def _answer_token_ids(self) -> Dict[str, List[int]]:
+        """
+        "Answer:" 다음에 올 수 있는 A/B/C/D 토큰 id (공백 포함/미포함 두 형태).
+        tokenizer마다 다르므로 처음 호출할 때 한 번만 계산.
+        """
+        if getattr(self, '_letter_token_ids', None) is None:
+            letter_token_ids = {}
+            for letter in ["A", "B", "C", "D"]:
+                ids = set()
+                for variant in (letter, f" {letter}"):
+                    encoded = self.tokenizer.encode(variant, add_special_tokens=False)
+                    # 한 토큰으로 표현되는 형태만 사용 (" A"가 공백+A로 쪼개지는 tokenizer 대비)
+                    if len(encoded) == 1:
+                        ids.add(encoded[0])
+                letter_token_ids[letter] = sorted(ids)
+            self._letter_token_ids = letter_token_ids
+        return self._letter_token_ids
+
+    def _pad_token_id(self) -> int:
+        return self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else self.tokenizer.eos_token_id
+
+    def _tokenize_batch(self, prompts: List[str]) -> dict:
+        """
+        여러 프롬프트를 left padding으로 묶어 tokenize.
+        (마지막 위치가 항상 실제 마지막 토큰이 되도록 왼쪽에 padding)
+        tokenizer는 model_registry로 생성기/LocalBackend와 공유하므로 padding_side나 pad_token을 바꾸지 않고 직접 padding합니다.
+        """
+        encoded = self.tokenizer(prompts)['input_ids']
+        max_length = max(len(ids) for ids in encoded)
+        input_ids = torch.full((len(encoded), max_length), self._pad_token_id(), dtype=torch.long)
+        attention_mask = torch.zeros((len(encoded), max_length), dtype=torch.long)
+        for row, ids in enumerate(encoded):
+            if ids:
+                input_ids[row, max_length - len(ids):] = torch.tensor(ids, dtype=torch.long)
+                attention_mask[row, max_length - len(ids):] = 1
+        inputs = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        if torch.cuda.is_available():
+            inputs = {k: v.to('cuda') for k, v in inputs.items()}
+        return inputs
+
+    def _length_buckets(self, prompts: List[str], batch_size: int) -> List[List[int]]:
+        """토큰 길이순으로 정렬한 뒤 batch_size씩 묶어 padding을 최소화 (원래 index 목록 반환)"""
+        lengths = [len(ids) for ids in self.tokenizer(prompts)['input_ids']]
+        order = sorted(range(len(prompts)), key=lambda i: lengths[i])
+        return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+    def _score_batch(self, prompts: List[str]) -> List[Dict[str, float]]:
+        """프롬프트 묶음에 대해 forward 한 번으로 "Answer:" 다음 토큰의 A/B/C/D 분포를 계산"""
+        inputs = self._tokenize_batch([prompt + "\nAnswer:" for prompt in prompts])
+        # left padding이므로 position id를 attention mask 기준으로 다시 계산
+        position_ids = (inputs['attention_mask'].cumsum(-1) - 1).clamp(min=0)
+
+        with torch.no_grad():
+            next_token_logits = self.model(**inputs, position_ids=position_ids).logits[:, -1].float()
+        log_probs = torch.log_softmax(next_token_logits, dim=-1)
+
+        letter_token_ids = self._answer_token_ids()
+        letters = list(letter_token_ids)
+        # 공백 포함/미포함 토큰 확률을 합친 뒤 네 보기에 대해서만 다시 정규화
+        letter_log_probs = torch.stack([
+            torch.logsumexp(log_probs[:, letter_token_ids[letter]], dim=-1) for letter in letters
+        ], dim=-1)
+        probs = torch.softmax(letter_log_probs, dim=-1).tolist()
+        return [dict(zip(letters, row)) for row in probs]
+
+    def score_answer(self, question: str, choices: dict) -> Tuple[str, Dict[str, float]]:
+        """
+        생성 없이 forward 한 번으로 "Answer:" 다음 토큰의 A/B/C/D 확률을 읽어 정답을 결정.
+        반환값: (가장 확률이 높은 답, 네 보기에 대해 정규화된 확률 분포)
+        """
+        distribution = self._score_batch([self._create_prompt(question, choices)])[0]
+        final_answer = max(distribution, key=distribution.get)
+        logger.debug(f"Answer distribution: {distribution}")
+        return final_answer, distribution
+
+    @staticmethod
+    def _format_distribution(final_answer: str, distribution: Dict[str, float]) -> Tuple[str, str]:
+        formatted = {letter: round(prob, 4) for letter, prob in distribution.items()}
+        return final_answer, f"Answer distribution: {formatted}, final: {final_answer}"
+
+    def _sample_answers(self, inputs: dict, num_samples: int) -> List[str]:
+        """
+        generate 한 번으로 num_samples개의 답을 샘플링 (프롬프트 prefill은 한 번만 수행).
+        추출에 실패한 샘플은 빈 문자열로 반환.
+        inputs가 여러 프롬프트의 batch면 프롬프트별로 num_samples개씩 이어서 반환.
+        """
+        with torch.no_grad():
+            outputs = self.model.generate(
+                **inputs,
+                max_new_tokens=100,
+                # do_sample=True 이면 랜덤성 높아짐.
+                # 다수결을 시험하기 위해 일단 do_sample=True 유지 가능.
+                # 더 일관된 결과를 원한다면 do_sample=False, temperature=0 등으로 바꿀 수도 있음.
+                do_sample=True,
+                temperature=0.7,
+                top_p=0.9,
+                num_return_sequences=num_samples,
+                eos_token_id=self.tokenizer.eos_token_id,
+                pad_token_id=self._pad_token_id()
+            )
+        # 프롬프트 부분을 제외한 생성 토큰만 디코딩
+        prompt_length = inputs['input_ids'].shape[1]
+        generated_texts = self.tokenizer.batch_decode(outputs[:, prompt_length:], skip_special_tokens=True)
+        return [self._extract_answer(text) for text in generated_texts]
+
+    @staticmethod
+    def _can_stop_early(counter: Counter, remaining: int, confidence_threshold: Optional[float]) -> bool:
+        """
+        남은 샘플을 모두 2위 답이 가져가도 1위를 따라잡을 수 없으면 True.
+        confidence_threshold가 주어지면 1위 답의 득표 비율이 이 값 이상일 때도 True.
+        """
+        if not counter:
+            return False
+        top = counter.most_common(2)
+        leader_count = top[0][1]
+        runner_up_count = top[1][1] if len(top) > 1 else 0
+        if leader_count - runner_up_count > remaining:
+            return True
+        if confidence_threshold is not None:
+            return leader_count / sum(counter.values()) >= confidence_threshold
+        return False
+
+    def check_answer(
+        self,
+        question: str,
+        choices: dict,
+        num_inferences: int = 10,
+        batched: bool = True,
+        adaptive: bool = False,
+        round_size: int = 3,
+        confidence_threshold: Optional[float] = None,
+        use_logits: bool = False
+    ) -> Tuple[str, str]:
         """
         1) 동일 질문에 대해 num_inferences번 반복 추론
+           (batched=True면 num_return_sequences로 한 번의 generate 호출에서 모두 샘플링,
+            False면 기존처럼 한 번에 하나씩 generate 호출)
+           adaptive=True면 round_size개씩 나눠 샘플링하고, 1위 답이 더 이상 뒤집힐 수 없거나
+           득표 비율이 confidence_threshold 이상이 되면 남은 샘플링을 생략
         2) 각각 "Answer: X" 형태를 파싱
         3) 최빈값(majority vote)을 최종 답으로 결정
-        4) explanation에는 debug용으로 전체 투표 결과를 간단 출력
+        4) explanation에는 debug용으로 전체 투표 결과와 실제 사용한 샘플 수를 간단 출력
+
+        use_logits=True면 샘플링 대신 score_answer로 한 번의 forward 결과를 사용
+        (explanation에는 보기별 확률 분포를 출력)
         """
+        if use_logits:
+            return self._format_distribution(*self.score_answer(question, choices))
 
         # 우선 프롬프트 생성
         prompt = self._create_prompt(question, choices)
@@ -109,27 +232,32 @@ class SelfConsistencyChecker:
         if torch.cuda.is_available():
             inputs = {k: v.to('cuda') for k, v in inputs.items()}
 
+        # 한 번의 generate 호출에서 뽑을 샘플 수
+        if not batched:
+            step = 1
+        elif adaptive:
+            step = max(1, round_size)
+        else:
+            step = num_inferences
+
         # 여러 번(=num_inferences) 추론
         answers = []
-        for _ in range(num_inferences):
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    **inputs,
-                    max_new_tokens=100,
-                    # do_sample=True 이면 랜덤성 높아짐.
-                    # 다수결을 시험하기 위해 일단 do_sample=True 유지 가능.
-                    # 더 일관된 결과를 원한다면 do_sample=False, temperature=0 등으로 바꿀 수도 있음.
-                    do_sample=True,
-                    temperature=0.7,
-                    top_p=0.9,
-                    num_return_sequences=1,
-                    eos_token_id=self.tokenizer.eos_token_id
-                )
-            generated_text = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-            extracted = self._extract_answer(generated_text)
-            if extracted in ["A", "B", "C", "D"]:
-                answers.append(extracted)
+        num_samples = 0
+        while num_samples < num_inferences:
+            sampled = self._sample_answers(inputs, min(step, num_inferences - num_samples))
+            num_samples += len(sampled)
+            answers.extend(answer for answer in sampled if answer in ["A", "B", "C", "D"])
+            if adaptive and self._can_stop_early(Counter(answers), num_inferences - num_samples, confidence_threshold):
+                # 마지막 round에서 조건을 만족한 경우는 절약한 샘플이 없으므로 기록하지 않음
+                if num_samples < num_inferences:
+                    logger.info(f"Early stop after {num_samples}/{num_inferences} samples")
+                break
+
+        return self._majority_vote(answers, num_samples, num_inferences)
 
+    @staticmethod
+    def _majority_vote(answers: List[str], num_samples: int, num_inferences: int) -> Tuple[str, str]:
+        """추출된 답들의 최빈값과 debug용 투표 결과 문자열 반환"""
         if not answers:
             # 아무 답도 추출 못했다면 fallback
             return "", "No valid answers extracted."
@@ -137,6 +265,41 @@ class SelfConsistencyChecker:
         # 다수결
         counter = Counter(answers)
         final_answer = counter.most_common(1)[0][0]  # 가장 많이 나온 1개
-        explanation = f"All answers: {answers}, counts: {dict(counter)}, final: {final_answer}"
+        explanation = (
+            f"All answers: {answers}, counts: {dict(counter)}, final: {final_answer}, "
+            f"samples used: {num_samples}/{num_inferences}"
+        )
 
         return final_answer, explanation
+
+    def check_answers_many(
+        self,
+        items: List[Tuple[str, dict]],
+        num_inferences: int = 10,
+        batch_size: int = 8,
+        use_logits: bool = False
+    ) -> List[Tuple[str, str]]:
+        """
+        여러 (question, choices)를 한꺼번에 검증. 결과는 입력 순서대로 check_answer와 같은 형식.
+        토큰 길이가 비슷한 프롬프트끼리 batch_size개씩 묶어 padding을 줄이고,
+        batch마다 generate(num_return_sequences=num_inferences) 또는 forward를 한 번만 호출.
+        (adaptive 조기 종료는 batch 단위로는 지원하지 않음)
+        """
+        prompts = [self._create_prompt(question, choices) for question, choices in items]
+        results = [None] * len(prompts)
+
+        for bucket in self._length_buckets(prompts, max(1, batch_size)):
+            bucket_prompts = [prompts[i] for i in bucket]
+            if use_logits:
+                for i, distribution in zip(bucket, self._score_batch(bucket_prompts)):
+                    results[i] = self._format_distribution(max(distribution, key=distribution.get), distribution)
+                continue
+
+            sampled = self._sample_answers(self._tokenize_batch(bucket_prompts), num_inferences)
+            for offset, i in enumerate(bucket):
+                per_prompt = sampled[offset * num_inferences:(offset + 1) * num_inferences]
+                answers = [answer for answer in per_prompt if answer in ["A", "B", "C", "D"]]
+                results[i] = self._majority_vote(answers, num_inferences, num_inferences)
+            logger.info(f"Verified batch of {len(bucket)} questions")
+
+        return results
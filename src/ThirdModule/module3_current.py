@@ -1,52 +1,30 @@
 # module3.py
-import requests
-from typing import Optional
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 import logging
-from dotenv import load_dotenv
-import os
+from src.llm_backend import LLMBackend, get_llm_backend
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# .env 파일 로드
-load_dotenv()
-
-# Hugging Face API 정보
-API_URL = "https://api-inference.huggingface.co/models/meta-llama/Meta-Llama-3-8B-Instruct"
-API_KEY = os.getenv("HUGGINGFACE_API_KEY")
-
-if not API_KEY:
-    raise ValueError("API_KEY가 설정되지 않았습니다. .env 파일을 확인하세요.")
+# 정답 문자 하나만 필요하므로 짧게 생성하고, 응답에 프롬프트(보기 A~D 포함)를 다시 붙이지 않음
+VERIFY_PARAMS = {"max_new_tokens": 8, "return_full_text": False}
+# 단어로 떨어진 보기 문자만 인정 ("ANSWER"의 A 같은 부분 문자열은 제외)
+ANSWER_PATTERN = re.compile(r"\b([ABCD])\b")
 
 class AnswerVerifier:
+    def __init__(self, backend: Optional[LLMBackend] = None):
+        """backend가 없으면 LLM_BACKEND 환경 변수로 고른 공용 backend 사용"""
+        self.backend = backend or get_llm_backend()
+
     def verify_answer(self, question: str, choices: dict) -> Optional[str]:
         """주어진 문제와 보기를 바탕으로 정답을 검증"""
         try:
             prompt = self._create_prompt(question, choices)
-            headers = {"Authorization": f"Bearer {API_KEY}"}
-            
-            response = requests.post(
-                API_URL,
-                headers=headers,
-                json={"inputs": prompt}
-            )
-            response.raise_for_status()
-            
-            response_data = response.json()
-            logger.debug(f"Raw API response: {response_data}")
-            
-            # API 응답 처리
-            generated_text = ""
-            if isinstance(response_data, list):
-                if response_data and isinstance(response_data[0], dict):
-                    generated_text = response_data[0].get('generated_text', '')
-                else:
-                    generated_text = response_data[0] if response_data else ''
-            elif isinstance(response_data, dict):
-                generated_text = response_data.get('generated_text', '')
-            else:
-                generated_text = str(response_data)
+            generated_text = self.backend.generate(prompt, VERIFY_PARAMS)
             
             verified_answer = self._extract_answer(generated_text)
             logger.info(f"Verified answer: {verified_answer}")
@@ -56,6 +34,24 @@ class AnswerVerifier:
             logger.error(f"Error in verify_answer: {e}")
             return None
 
+    def verify_answers_many(self, items: List[Tuple[str, dict]], concurrency: int = 4) -> List[Optional[str]]:
+        """여러 (question, choices)를 동시에 검증 (최대 concurrency개 동시 호출). 결과는 입력 순서대로"""
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            return list(executor.map(lambda item: self.verify_answer(*item), items))
+
+    def check_answer(self, question: str, choices: dict, num_inferences: int = 1) -> Tuple[str, str]:
+        """
+        SelfConsistencyChecker.check_answer와 같은 (정답, 설명) 형식으로 backend 검증 결과를 반환
+        (num_inferences번 호출한 결과의 다수결). PipelineRunner의 checker로 사용할 수 있습니다.
+        유효한 답을 하나도 얻지 못하면 정답은 빈 문자열입니다.
+        """
+        answers = [self.verify_answer(question, choices) for _ in range(max(1, num_inferences))]
+        counter = Counter(answer for answer in answers if answer)
+        if not counter:
+            return "", f"backend '{self.backend.name}' returned no valid answer"
+        answer, count = counter.most_common(1)[0]
+        return answer, f"backend '{self.backend.name}' votes: {dict(counter)} ({count}/{len(answers)})"
+
     def _create_prompt(self, question: str, choices: dict) -> str:
         """검증을 위한 프롬프트 생성"""
         return f"""
@@ -79,13 +75,12 @@ class AnswerVerifier:
         """.strip()
 
     def _extract_answer(self, response: str) -> Optional[str]:
-        """응답에서 A, B, C, D 중 하나를 추출"""
-        response = response.strip().upper()
-        valid_answers = {'A', 'B', 'C', 'D'}
-        
-        # 응답에서 유효한 답안 찾기
-        for answer in valid_answers:
-            if answer in response:
-                return answer
-        
+        """응답에서 A, B, C, D 중 처음 나오는 하나를 추출"""
+        response = response.strip()
+        match = ANSWER_PATTERN.search(response)
+        if match:
+            return match.group(1)
+        # 소문자 한 글자로만 답한 경우
+        if response.upper() in ('A', 'B', 'C', 'D'):
+            return response.upper()
         return None
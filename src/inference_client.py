@@ -0,0 +1,191 @@
+# inference_client.py
+# Hugging Face Inference API 호출을 위한 공용 HTTP 클라이언트 (connection pool, timeout, retry, hedging, streaming)
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterator, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# 429: rate limit, 503: HF "model is currently loading", 502/504: 게이트웨이 오류
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+
+def extract_generated_text(response_data) -> str:
+    """Inference API 응답(list/dict/기타)에서 generated_text를 꺼냄"""
+    # API 응답이 리스트인 경우 처리
+    if isinstance(response_data, list):
+        if response_data and isinstance(response_data[0], dict):
+            return response_data[0].get('generated_text', '')
+        return response_data[0] if response_data else ''
+    # API 응답이 딕셔너리인 경우 처리
+    if isinstance(response_data, dict):
+        return response_data.get('generated_text', '')
+    return str(response_data)
+
+
+def parse_stream_event(line: str) -> Optional[str]:
+    """
+    스트리밍 응답(server-sent events)의 한 줄에서 토큰 텍스트를 꺼냄.
+    data 줄이 아니거나 special token이면 None, 서버가 error 이벤트를 보내면 RuntimeError
+    """
+    line = line.strip()
+    if not line.startswith("data:"):
+        return None
+    data = line[len("data:"):].strip()
+    if not data or data == "[DONE]":
+        return None
+    event = json.loads(data)
+    if "error" in event:
+        raise RuntimeError(f"Inference stream error: {event['error']}")
+    token = event.get("token") or {}
+    if token.get("special"):
+        return None
+    return token.get("text") or None
+
+
+class InferenceClient:
+    """
+    keep-alive 세션을 재사용하는 inference 클라이언트.
+
+    - timeout: (connect, read) 초
+    - max_retries: 429/5xx 및 연결 오류 시 재시도 횟수 (jitter가 들어간 지수 backoff)
+    - hedge_after: 설정 시, 첫 요청이 이 시간(초) 안에 끝나지 않으면 동일 요청을 하나 더 보내
+      먼저 성공한 응답을 사용 (tail latency 완화, 대신 호출 비용이 늘어날 수 있음)
+    """
+
+    def __init__(
+        self,
+        timeout: Tuple[float, float] = (5.0, 60.0),
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        hedge_after: Optional[float] = None,
+        pool_size: int = 10,
+    ):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size) if hedge_after is not None else None
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """재시도 대기 시간. Retry-After 또는 HF의 estimated_time이 있으면 우선 사용"""
+        delay = None
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    delay = float(retry_after)
+                except ValueError:
+                    delay = None
+            if delay is None and response.status_code == 503:
+                try:
+                    delay = float(response.json().get("estimated_time"))
+                except (ValueError, TypeError, AttributeError):
+                    delay = None
+        if delay is None:
+            # full jitter
+            delay = random.uniform(0, self.backoff_base * (2 ** attempt))
+        return min(delay, self.backoff_max)
+
+    def _post_with_retries(self, url: str, payload: dict, headers: Optional[dict], stream: bool = False) -> requests.Response:
+        for attempt in range(self.max_retries + 1):
+            is_last = attempt == self.max_retries
+            try:
+                response = self.session.post(url, headers=headers, json=payload, timeout=self.timeout, stream=stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if is_last:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"Inference request failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES and not is_last:
+                delay = self._backoff(attempt, response)
+                # stream=True 응답은 body를 읽기 전까지 pool 연결을 잡고 있으므로 재시도 전에 반납
+                response.close()
+                logger.warning(f"Inference API returned {response.status_code}; retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            if not response.ok:
+                response.close()
+            response.raise_for_status()
+            return response
+
+    def post(self, url: str, payload: dict, headers: Optional[dict] = None) -> requests.Response:
+        """POST 요청을 보내고 성공한 Response를 반환. 실패 시 requests 예외를 그대로 발생"""
+        if self._executor is None:
+            return self._post_with_retries(url, payload, headers)
+
+        first = self._executor.submit(self._post_with_retries, url, payload, headers)
+        done, _ = wait([first], timeout=self.hedge_after)
+        if done:
+            return first.result()
+
+        logger.info(f"Inference request slower than {self.hedge_after}s; sending hedged request")
+        pending = {first, self._executor.submit(self._post_with_retries, url, payload, headers)}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except requests.exceptions.RequestException as e:
+                    error = e
+        raise error
+
+    def post_json(self, url: str, payload: dict, headers: Optional[dict] = None):
+        return self.post(url, payload, headers).json()
+
+    def post_stream(self, url: str, payload: dict, headers: Optional[dict] = None) -> Iterator[str]:
+        """
+        "stream": true로 요청해 생성되는 토큰 텍스트를 순서대로 yield.
+        응답을 받기 전까지는 post와 같이 재시도하지만, 스트림 도중 끊기면 예외를 그대로 발생시킵니다 (hedging 미사용).
+        """
+        response = self._post_with_retries(url, {**payload, "stream": True}, headers, stream=True)
+        # SSE는 항상 UTF-8 (charset이 없으면 requests가 text/*를 ISO-8859-1로 디코딩해 ×, £ 등이 깨짐)
+        response.encoding = "utf-8"
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    continue
+                text = parse_stream_event(line)
+                if text:
+                    yield text
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_inference_client() -> InferenceClient:
+    """프로세스 전체에서 공유하는 클라이언트 (환경 변수로 설정)"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            hedge_after = os.getenv("INFERENCE_HEDGE_AFTER")
+            _default_client = InferenceClient(
+                timeout=(
+                    float(os.getenv("INFERENCE_CONNECT_TIMEOUT", "5")),
+                    float(os.getenv("INFERENCE_READ_TIMEOUT", "60")),
+                ),
+                max_retries=int(os.getenv("INFERENCE_MAX_RETRIES", "3")),
+                hedge_after=float(hedge_after) if hedge_after else None,
+            )
+        return _default_client
@@ -0,0 +1,207 @@
+# llm_backend.py
+# 문제 생성/정답 검증이 사용하는 LLM 호출 backend (원격 HTTP, 로컬 transformers, 오프라인 stub 서버) 선택
+import logging
+import os
+import threading
+from typing import Iterator, Optional
+
+from dotenv import load_dotenv
+
+from src.config import Llama3_8b_PATH
+from src.inference_client import extract_generated_text, get_inference_client
+
+logger = logging.getLogger(__name__)
+
+# .env 파일 로드
+load_dotenv()
+
+DEFAULT_MODEL_ID = "meta-llama/Meta-Llama-3-8B-Instruct"
+DEFAULT_API_URL = f"https://api-inference.huggingface.co/models/{DEFAULT_MODEL_ID}"
+DEFAULT_STUB_URL = "http://127.0.0.1:8089/"
+BACKEND_NAMES = ("remote", "local", "stub")
+
+
+class LLMBackend:
+    """
+    prompt → 생성 텍스트 인터페이스.
+    params는 HF Inference API의 parameters 형식 (max_new_tokens, temperature, top_p, stop, return_full_text 등).
+    model_id는 응답 캐시 키에 들어가므로 backend마다 달라야 합니다.
+    """
+
+    name = "base"
+    model_id = "unknown"
+
+    def generate(self, prompt: str, params: Optional[dict] = None) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, params: Optional[dict] = None) -> Iterator[str]:
+        """생성 텍스트를 조각 단위로 yield (기본 구현은 generate 결과를 한 번에)"""
+        yield self.generate(prompt, params)
+
+
+class RemoteBackend(LLMBackend):
+    """HF Inference API 형식의 HTTP endpoint ({"inputs", "parameters", "stream"})를 호출"""
+
+    name = "remote"
+
+    def __init__(self, api_url: str = DEFAULT_API_URL, api_key: Optional[str] = None, model_id: str = DEFAULT_MODEL_ID, require_api_key: bool = True, name: str = "remote"):
+        self.name = name
+        self.api_url = api_url
+        self.api_key = api_key
+        self.model_id = model_id
+        self.require_api_key = require_api_key
+
+    def _headers(self) -> dict:
+        if not self.api_key:
+            if self.require_api_key:
+                # import 시점이 아니라 실제 호출 시점에 확인 (stub/local backend만 쓰는 환경에서도 import 가능)
+                raise ValueError("API_KEY가 설정되지 않았습니다. .env 파일을 확인하세요.")
+            return {}
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    def _payload(self, prompt: str, params: Optional[dict]) -> dict:
+        payload = {"inputs": prompt}
+        if params:
+            payload["parameters"] = params
+        return payload
+
+    def generate(self, prompt: str, params: Optional[dict] = None) -> str:
+        response_data = get_inference_client().post_json(self.api_url, self._payload(prompt, params), self._headers())
+        logger.debug(f"Raw API response: {response_data}")
+        return extract_generated_text(response_data)
+
+    def stream(self, prompt: str, params: Optional[dict] = None) -> Iterator[str]:
+        yield from get_inference_client().post_stream(self.api_url, self._payload(prompt, params), self._headers())
+
+
+def _abort_criteria(abort: threading.Event):
+    """abort가 set되면 다음 토큰에서 model.generate를 멈추는 StoppingCriteria (스트림 소비자가 멈춘 경우)"""
+    import torch
+    from transformers import StoppingCriteria
+
+    class AbortCriteria(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return torch.full((input_ids.shape[0],), abort.is_set(), dtype=torch.bool, device=input_ids.device)
+
+    return AbortCriteria()
+
+
+class LocalBackend(LLMBackend):
+    """
+    같은 프로세스의 transformers 모델로 생성 (model_registry로 module2_ori/module3와 모델 공유).
+    torch/transformers는 처음 생성할 때 import합니다.
+    """
+
+    name = "local"
+
+    def __init__(self, model_name: str = DEFAULT_MODEL_ID, cache_dir: Optional[str] = Llama3_8b_PATH):
+        self.model_name = model_name
+        self.model_id = f"local:{model_name}"
+        self.cache_dir = cache_dir
+
+    def _generation_kwargs(self, tokenizer, params: Optional[dict]) -> dict:
+        params = params or {}
+        temperature = params.get("temperature", 0.7)
+        kwargs = dict(
+            max_new_tokens=params.get("max_new_tokens", 256),
+            do_sample=temperature > 0,
+            eos_token_id=tokenizer.eos_token_id,
+        )
+        if temperature > 0:
+            kwargs.update(temperature=temperature, top_p=params.get("top_p", 0.9))
+        if params.get("stop"):
+            kwargs.update(stop_strings=list(params["stop"]), tokenizer=tokenizer)
+        return kwargs
+
+    @staticmethod
+    def _truncate_at_stop(text: str, params: Optional[dict]) -> str:
+        for stop in (params or {}).get("stop") or []:
+            position = text.find(stop)
+            if position != -1:
+                text = text[:position]
+        return text
+
+    def generate(self, prompt: str, params: Optional[dict] = None) -> str:
+        import torch
+        from src.model_registry import load_shared_model
+
+        tokenizer, model = load_shared_model(self.model_name, cache_dir=self.cache_dir)
+        inputs = tokenizer(prompt, return_tensors='pt').to(model.device)
+        with torch.no_grad():
+            outputs = model.generate(**inputs, **self._generation_kwargs(tokenizer, params))
+        # 프롬프트를 제외한 새 토큰만 decode (return_full_text=False와 같은 결과)
+        text = tokenizer.decode(outputs[0, inputs['input_ids'].shape[1]:], skip_special_tokens=True)
+        return self._truncate_at_stop(text, params)
+
+    def stream(self, prompt: str, params: Optional[dict] = None) -> Iterator[str]:
+        """
+        소비자가 중간에 멈추면 (stop sequence, stream_model_api의 문제 완성 후 break 등)
+        abort 플래그로 model.generate도 다음 토큰에서 멈춰 공유 모델을 max_new_tokens까지 잡고 있지 않게 합니다.
+        """
+        import torch
+        from transformers import StoppingCriteriaList, TextIteratorStreamer
+        from src.model_registry import load_shared_model
+
+        tokenizer, model = load_shared_model(self.model_name, cache_dir=self.cache_dir)
+        inputs = tokenizer(prompt, return_tensors='pt').to(model.device)
+        streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        abort = threading.Event()
+        kwargs = dict(
+            **inputs,
+            **self._generation_kwargs(tokenizer, params),
+            streamer=streamer,
+            stopping_criteria=StoppingCriteriaList([_abort_criteria(abort)]),
+        )
+
+        def run():
+            with torch.no_grad():
+                model.generate(**kwargs)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        text = ""
+        try:
+            for chunk in streamer:
+                # stop sequence 이후는 내보내지 않음
+                combined = text + chunk
+                truncated = self._truncate_at_stop(combined, params)
+                if len(truncated) > len(text):
+                    yield truncated[len(text):]
+                text = truncated
+                if len(truncated) < len(combined):
+                    break
+        finally:
+            abort.set()
+            thread.join()
+
+
+def create_backend(name: Optional[str] = None) -> LLMBackend:
+    """
+    환경 변수로 backend 생성.
+    LLM_BACKEND: remote(기본) / local / stub
+    - remote: LLM_API_URL (기본 HF Inference API), HUGGINGFACE_API_KEY
+    - local: LLM_LOCAL_MODEL (기본 Llama-3-8B-Instruct, src.config.Llama3_8b_PATH 캐시)
+    - stub: LLM_STUB_URL (기본 http://127.0.0.1:8089/, `python -m src.stub_server`로 실행)
+    """
+    name = (name or os.getenv("LLM_BACKEND", "remote")).lower()
+    if name == "remote":
+        return RemoteBackend(os.getenv("LLM_API_URL", DEFAULT_API_URL), os.getenv("HUGGINGFACE_API_KEY"))
+    if name == "local":
+        return LocalBackend(os.getenv("LLM_LOCAL_MODEL", DEFAULT_MODEL_ID))
+    if name == "stub":
+        return RemoteBackend(os.getenv("LLM_STUB_URL", DEFAULT_STUB_URL), model_id="stub", require_api_key=False, name="stub")
+    raise ValueError(f"지원하지 않는 LLM backend입니다: {name} (가능: {BACKEND_NAMES})")
+
+
+_default_backend = None
+_default_backend_lock = threading.Lock()
+
+
+def get_llm_backend() -> LLMBackend:
+    """프로세스 전체에서 공유하는 backend (LLM_BACKEND 환경 변수로 선택)"""
+    global _default_backend
+    with _default_backend_lock:
+        if _default_backend is None:
+            _default_backend = create_backend()
+            logger.info(f"Using LLM backend '{_default_backend.name}' ({_default_backend.model_id})")
+        return _default_backend
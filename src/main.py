@@ -1,108 +1,105 @@
-import pandas as pd
-from module1 import MisconceptionPredictor
-from module2 import SimilarQuestionGenerator
-from module3 import SelfConsistencyChecker
+import argparse
+from src.FisrtModule.module1 import MisconceptionPredictor
+from src.FisrtModule.retriever import MisconceptionRetriever
+from src.SecondModule.module2 import SimilarQuestionGenerator
+from src.ThirdModule.module3_current import AnswerVerifier
+from src.pipeline import PipelineRunner
+from src.question_bank import load_question_bank
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Module1 → Module2 → Module3 파이프라인 실행")
+    parser.add_argument("--train-csv", default="train_updated.csv")
+    parser.add_argument("--misconception-csv", default="misconception_mapping.csv")
+    parser.add_argument("--limit", type=int, default=10, help="처리할 행 수 (0이면 전체)")
+    parser.add_argument("--generation-workers", type=int, default=2)
+    parser.add_argument("--verification-workers", type=int, default=1)
+    parser.add_argument("--max-in-flight", type=int, default=8, help="동시에 처리 중인 최대 행 수")
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--num-inferences", type=int, default=10)
+    parser.add_argument("--use-retriever", action="store_true", help="라벨 대신 임베딩 검색으로 misconception 예측")
+    parser.add_argument("--ann", action="store_true", help="--use-retriever 사용 시 IVF 근사 검색 인덱스로 검색 (없으면 전체 검색)")
+    parser.add_argument("--n-probe", type=int, default=8, help="--ann 사용 시 질의마다 탐색할 군집 수")
+    parser.add_argument("--checker", choices=["local", "backend"], default="local",
+                        help="local: transformers self-consistency 검증, backend: LLM_BACKEND(remote/local/stub)로 검증")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="local 검증에서 round-size개씩 샘플링하고 다수결이 확정되면 남은 샘플링 생략")
+    parser.add_argument("--round-size", type=int, default=3)
+    parser.add_argument("--confidence-threshold", type=float, default=None,
+                        help="--adaptive 사용 시 1위 답의 득표 비율이 이 값 이상이면 조기 종료")
+    return parser.parse_args()
+
+
+def print_result(result):
+    print(f"\n[Row {result.row_id}]")
+    print("[Module1 Output]")
+    print("Misconception Id:", result.misconception_id)
+    print("Misconception Text:", result.misconception_text)
+
+    if result.status == "no_question":
+        print("[Module2 Output] No valid question generated. Skipping Module3.")
+    elif result.status == "failed":
+        print("처리 중 오류 발생:", result.error)
+
+    gen_question = result.question
+    if gen_question:
+        # 출력
+        print("\n[Module2 Output] Generated Similar Question:")
+        print("Question:", gen_question.question)
+        for k, v in gen_question.choices.items():
+            print(f"{k}) {v}")
+        print("Correct Answer (Gold):", gen_question.correct_answer)
+        print("Explanation:", gen_question.explanation)
+
+    if result.predicted_answer or result.status in ("accepted", "rejected"):
+        print("\n[Module3 Output] Self-Consistency Check (Majority Vote) Result:")
+        print("Predicted Answer:", result.predicted_answer)
+        print("Gold Answer:", gen_question.correct_answer)
+
+    if result.status == "accepted":
+        print("=> 정답 일치! 문항 제공을 진행합니다.")
+    elif result.status == "rejected":
+        print("재생성 한도 초과! 문항 생성을 중단합니다.")
+
+    print(f"재생성 횟수(mismatch_count): {result.mismatch_count}")
+    print("--------------------------------------------------------")
+
 
 if __name__ == "__main__":
+    args = parse_args()
+    if args.adaptive and args.checker != "local":
+        raise SystemExit("--adaptive는 --checker local에서만 사용할 수 있습니다.")
+
     # train.csv 로드
-    df = pd.read_csv('train_updated.csv')
+    df = load_question_bank(args.train_csv)
+    if args.limit:
+        df = df.iloc[:args.limit]
 
     # 모듈 초기화
-    predictor = MisconceptionPredictor(misconception_csv_path='misconception_mapping.csv')
-    generator = SimilarQuestionGenerator(misconception_csv_path='misconception_mapping.csv')
-    checker = SelfConsistencyChecker()
-
-    # 앞 10행에 대해 파이프라인 수행
-    for idx, row in df.iloc[:10].iterrows():
-        construct_name = row['ConstructName']
-        subject_name = row['SubjectName']
-        question_text = row['QuestionText']
-        correct_answer = row['CorrectAnswer'].strip()  # 'A', 'B', 'C', 'D' 중 하나
-        correct_answer_text = row[f"Answer{correct_answer}Text"]
-
-        # 원본 문제의 4개 선지 텍스트 (필요 시 비교용)
-        original_choices = {
-            "A": row["AnswerAText"],
-            "B": row["AnswerBText"],
-            "C": row["AnswerCText"],
-            "D": row["AnswerDText"],
-        }
-
-        # 틀린 선지 하나 선택
-        possible_answers = ['A', 'B', 'C', 'D']
-        wrong_answer_candidates = [ans for ans in possible_answers if ans != correct_answer]
-        wrong_answer = wrong_answer_candidates[0]
-        wrong_answer_text = row[f"Answer{wrong_answer}Text"]
-
-        # Module1 호출
-        misconception_id, misconception_text = predictor.predict_misconception(
-            construct_name,
-            subject_name,
-            question_text,
-            correct_answer_text,
-            wrong_answer_text,
-            wrong_answer,
-            row
-        )
-
-        print(f"\n[Row {idx}]")
-        print("[Module1 Output]")
-        print("Misconception Id:", misconception_id)
-        print("Misconception Text:", misconception_text)
-
-        # ----------------------------
-        #    재생성 루프 (Module2→3)
-        # ----------------------------
-        mismatch_count = 0
-        max_retries = 5
-
-        while True:
-            # Module2 호출: 유사 문항 생성
-            gen_question, raw_output = generator.generate_similar_question_with_text(
-                construct_name=construct_name,
-                subject_name=subject_name,
-                question_text=question_text,
-                correct_answer_text=correct_answer_text,
-                wrong_answer_text=wrong_answer_text,
-                misconception_id=misconception_id
-            )
-
-            if not gen_question:
-                print("[Module2 Output] No valid question generated. Skipping Module3.")
-                break
-
-            # 출력
-            print("\n[Module2 Output] Generated Similar Question:")
-            print("Question:", gen_question.question)
-            for k, v in gen_question.choices.items():
-                print(f"{k}) {v}")
-            print("Correct Answer (Gold):", gen_question.correct_answer)
-            print("Explanation:", gen_question.explanation)
-
-            # Module3: 10번 추론 → 다수결 결과
-            predicted_answer, explanation = checker.check_answer(
-                question=gen_question.question,
-                choices=gen_question.choices,
-                num_inferences=10
-            )
-
-            print("\n[Module3 Output] Self-Consistency Check (Majority Vote) Result:")
-            print("Predicted Answer:", predicted_answer)
-            print("Gold Answer:", gen_question.correct_answer)
-
-            # 비교 (gold answer vs predicted_answer)
-            # gold answer가 "A) ..." 처럼 되어 있으면, "A" 부분만 떼어 비교해야 할 수도 있음
-            gold_answer_letter = gen_question.correct_answer.split(")")[0].strip()  # "A)" -> "A"
-
-            if predicted_answer.upper() == gold_answer_letter.upper():
-                print("=> 정답 일치! 문항 제공을 진행합니다.")
-                break
-            else:
-                mismatch_count += 1
-                print("=> 정답 불일치, 문제를 재생성합니다.")
-                if mismatch_count >= max_retries:
-                    print("재생성 한도 초과! 문항 생성을 중단합니다.")
-                    break
-
-        print(f"재생성 횟수(mismatch_count): {mismatch_count}")
-        print("--------------------------------------------------------")
+    retriever = MisconceptionRetriever(ann=args.ann, n_probe=args.n_probe) if args.use_retriever else None
+    predictor = MisconceptionPredictor(misconception_csv_path=args.misconception_csv, retriever=retriever)
+    generator = SimilarQuestionGenerator(misconception_csv_path=args.misconception_csv)
+    if args.checker == "backend":
+        checker = AnswerVerifier()
+    else:
+        # torch/transformers 모델 로드는 local 검증을 쓸 때만
+        from src.ThirdModule.module3 import SelfConsistencyChecker
+        checker = SelfConsistencyChecker()
+
+    # 생성(Module2)과 검증(Module3)을 별도 worker pool에서 파이프라인으로 수행
+    # (정답 불일치 시 max_retries까지 재생성), 결과는 행 순서대로 출력
+    runner = PipelineRunner(
+        predictor,
+        generator,
+        checker,
+        generation_workers=args.generation_workers,
+        verification_workers=args.verification_workers,
+        max_in_flight=args.max_in_flight,
+        max_retries=args.max_retries,
+        num_inferences=args.num_inferences,
+        check_options=dict(
+            adaptive=True, round_size=args.round_size, confidence_threshold=args.confidence_threshold
+        ) if args.adaptive else None,
+    )
+    for result in runner.run(df.iterrows()):
+        print_result(result)
@@ -0,0 +1,105 @@
+# misconception_catalog.py
+# misconception_mapping.csv를 한 번만 읽어 id → 텍스트 조회를 O(1)로 제공하는 공용 카탈로그
+import logging
+import os
+from functools import lru_cache
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class MisconceptionCatalog:
+    """
+    MisconceptionId → MisconceptionName 읽기 전용 카탈로그.
+
+    모든 이름은 하나의 문자열에 이어 붙여 저장하고, id로 인덱싱되는
+    offset 배열로 슬라이싱합니다 (행마다 파이썬 문자열/DataFrame 행을 두지 않음).
+    """
+
+    __slots__ = ("_text", "_starts", "_ends", "_ids")
+
+    def __init__(self, ids: Iterable[int], names: Iterable[str]):
+        ids = np.asarray(list(ids), dtype=np.int64)
+        names = [str(name) for name in names]
+        if len(ids) != len(names):
+            raise ValueError("ids와 names의 길이가 다릅니다.")
+        if len(ids) and ids.min() < 0:
+            raise ValueError("MisconceptionId는 0 이상이어야 합니다.")
+
+        size = int(ids.max()) + 1 if len(ids) else 0
+        lengths = np.fromiter((len(name) for name in names), dtype=np.int64, count=len(names))
+        ends = np.cumsum(lengths)
+
+        # id로 바로 인덱싱할 수 있는 dense 배열 (빈 슬롯은 start == end == -1)
+        starts_by_id = np.full(size, -1, dtype=np.int64)
+        ends_by_id = np.full(size, -1, dtype=np.int64)
+        starts_by_id[ids] = ends - lengths
+        ends_by_id[ids] = ends
+        starts_by_id.setflags(write=False)
+        ends_by_id.setflags(write=False)
+        ids.setflags(write=False)
+
+        object.__setattr__(self, "_text", "".join(names))
+        object.__setattr__(self, "_starts", starts_by_id)
+        object.__setattr__(self, "_ends", ends_by_id)
+        object.__setattr__(self, "_ids", ids)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("MisconceptionCatalog is immutable")
+
+    @classmethod
+    def from_csv(cls, csv_path: str) -> "MisconceptionCatalog":
+        """misconception_mapping.csv 형식(MisconceptionId, MisconceptionName)에서 생성"""
+        logger.info(f"Loading misconception catalog from {csv_path}...")
+        df = pd.read_csv(csv_path)
+        return cls(df["MisconceptionId"].astype("int64"), df["MisconceptionName"])
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, misconception_id) -> bool:
+        return self._slot(misconception_id) is not None
+
+    @property
+    def ids(self) -> np.ndarray:
+        """카탈로그에 포함된 MisconceptionId (CSV 순서, 읽기 전용)"""
+        return self._ids
+
+    def _slot(self, misconception_id) -> Optional[int]:
+        try:
+            if pd.isna(misconception_id):
+                return None
+            idx = int(misconception_id)
+        except (TypeError, ValueError):
+            return None
+        if idx < 0 or idx >= len(self._starts) or self._starts[idx] < 0:
+            return None
+        return idx
+
+    def get(self, misconception_id, default: Optional[str] = None) -> Optional[str]:
+        """id에 해당하는 misconception 텍스트를 반환 (없거나 NaN이면 default)"""
+        idx = self._slot(misconception_id)
+        if idx is None:
+            return default
+        return self._text[self._starts[idx]:self._ends[idx]]
+
+    def get_many(self, misconception_ids: Iterable, default: Optional[str] = None) -> List[Optional[str]]:
+        """여러 id를 한 번에 조회. 입력 순서대로 결과를 반환"""
+        return [self.get(misconception_id, default) for misconception_id in misconception_ids]
+
+
+@lru_cache(maxsize=None)
+def _load_catalog(abs_path: str, mtime: float) -> MisconceptionCatalog:
+    return MisconceptionCatalog.from_csv(abs_path)
+
+
+def load_catalog(csv_path: str) -> MisconceptionCatalog:
+    """
+    프로세스 내에서 공유되는 카탈로그를 반환.
+    같은 CSV에 대해서는 파일이 바뀌지 않는 한 한 번만 로드합니다.
+    """
+    abs_path = os.path.abspath(csv_path)
+    return _load_catalog(abs_path, os.path.getmtime(abs_path))
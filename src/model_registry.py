@@ -0,0 +1,144 @@
+# model_registry.py
+# 프로세스 전체에서 (모델, dtype, device)별로 한 번만 로드해 공유하는 causal LM 레지스트리
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+logger = logging.getLogger(__name__)
+
+
+def default_device() -> str:
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def default_dtype() -> torch.dtype:
+    """기존 모듈과 같은 기본값: GPU는 bfloat16, CPU는 float32"""
+    return torch.bfloat16 if torch.cuda.is_available() else torch.float32
+
+
+@dataclass
+class LoadedModel:
+    model_name: str
+    dtype: torch.dtype
+    device: str
+    tokenizer: object
+    model: object
+    load_seconds: float
+    memory_bytes: int     # 파라미터 + buffer 크기
+
+
+def model_memory_bytes(model) -> int:
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class ModelRegistry:
+    """
+    (model_name, dtype, device)를 키로 tokenizer와 model을 한 번만 로드해 같은 객체를 나눠 줍니다.
+    생성기(module2_ori)와 검증기(module3)가 같은 Llama-3-8B를 쓰면 메모리에 한 벌만 올라갑니다.
+    공유 객체이므로 사용하는 쪽에서 모델 가중치를 바꾸면 안 됩니다 (eval 모드로 로드).
+    """
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, str, str], LoadedModel] = {}
+        self._key_locks: Dict[Tuple[str, str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        model_name: str,
+        cache_dir: Optional[str] = None,
+        dtype: Optional[torch.dtype] = None,
+        device: Optional[str] = None
+    ) -> LoadedModel:
+        dtype = dtype or default_dtype()
+        device = device or default_device()
+        key = (model_name, str(dtype), device)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                logger.info(f"Reusing loaded model '{model_name}' ({dtype}, {device})")
+                return entry
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # 같은 키를 동시에 요청하면 한 스레드만 로드하고 나머지는 기다렸다가 결과를 공유
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None:
+                return entry
+            entry = self._load(model_name, cache_dir, dtype, device)
+            with self._lock:
+                self._entries[key] = entry
+            return entry
+
+    def _load(self, model_name: str, cache_dir: Optional[str], dtype: torch.dtype, device: str) -> LoadedModel:
+        logger.info(f"Loading model '{model_name}' from '{cache_dir}' ({dtype}, {device})...")
+        start = time.perf_counter()
+        tokenizer = AutoTokenizer.from_pretrained(model_name, cache_dir=cache_dir, trust_remote_code=True)
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name,
+            cache_dir=cache_dir,
+            torch_dtype=dtype,
+            trust_remote_code=True
+        )
+        # device_map(accelerate) 없이 한 장치에 통째로 올림
+        model.to(device)
+        model.eval()
+        entry = LoadedModel(
+            model_name=model_name,
+            dtype=dtype,
+            device=device,
+            tokenizer=tokenizer,
+            model=model,
+            load_seconds=time.perf_counter() - start,
+            memory_bytes=model_memory_bytes(model),
+        )
+        logger.info(
+            f"Model '{model_name}' loaded on {device} in {entry.load_seconds:.1f}s "
+            f"({entry.memory_bytes / 1e9:.2f} GB)"
+        )
+        return entry
+
+    def release(self, model_name: str, dtype: Optional[torch.dtype] = None, device: Optional[str] = None) -> bool:
+        """레지스트리에서 모델을 제거 (다른 곳에서 참조 중이면 그 참조가 사라질 때 메모리가 해제됨)"""
+        key = (model_name, str(dtype or default_dtype()), device or default_device())
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def stats(self) -> List[dict]:
+        with self._lock:
+            return [
+                {
+                    "model_name": entry.model_name,
+                    "dtype": str(entry.dtype),
+                    "device": entry.device,
+                    "load_seconds": entry.load_seconds,
+                    "memory_bytes": entry.memory_bytes,
+                }
+                for entry in self._entries.values()
+            ]
+
+
+_registry = ModelRegistry()
+
+
+def get_model_registry() -> ModelRegistry:
+    """프로세스 전체에서 공유하는 레지스트리"""
+    return _registry
+
+
+def load_shared_model(
+    model_name: str,
+    cache_dir: Optional[str] = None,
+    dtype: Optional[torch.dtype] = None,
+    device: Optional[str] = None
+) -> Tuple[object, object]:
+    """공유 레지스트리에서 (tokenizer, model)을 가져옴 (처음 요청 시에만 로드)"""
+    entry = _registry.get(model_name, cache_dir=cache_dir, dtype=dtype, device=device)
+    return entry.tokenizer, entry.model
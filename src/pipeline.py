@@ -0,0 +1,232 @@
+# pipeline.py
+# Module1 → Module2(생성) → Module3(검증) 파이프라인을 행 단위로 병렬 처리하는 runner
+import logging
+import queue
+import threading
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+@dataclass
+class PipelineResult:
+    index: int
+    row_id: object
+    misconception_id: int
+    misconception_text: str
+    question: Optional[object] = None  # GeneratedQuestion
+    predicted_answer: str = ""
+    explanation: str = ""
+    mismatch_count: int = 0
+    status: str = "pending"  # accepted / rejected / no_question / failed
+    error: Optional[str] = None
+    attempts: List[dict] = field(default_factory=list)
+
+
+def build_task(index: int, row_id, row, predictor) -> dict:
+    """train.csv 한 행에서 생성/검증에 필요한 입력을 준비 (Module1 호출 포함)"""
+    correct_answer = row['CorrectAnswer'].strip()  # 'A', 'B', 'C', 'D' 중 하나
+    correct_answer_text = row[f"Answer{correct_answer}Text"]
+
+    # 틀린 선지 하나 선택
+    wrong_answer = [ans for ans in ['A', 'B', 'C', 'D'] if ans != correct_answer][0]
+    wrong_answer_text = row[f"Answer{wrong_answer}Text"]
+
+    # Module1 호출
+    misconception_id, misconception_text = predictor.predict_misconception(
+        row['ConstructName'],
+        row['SubjectName'],
+        row['QuestionText'],
+        correct_answer_text,
+        wrong_answer_text,
+        wrong_answer,
+        row
+    )
+    return {
+        'result': PipelineResult(index, row_id, misconception_id, misconception_text),
+        'generation_input': {
+            'construct_name': row['ConstructName'],
+            'subject_name': row['SubjectName'],
+            'question_text': row['QuestionText'],
+            'correct_answer_text': correct_answer_text,
+            'wrong_answer_text': wrong_answer_text,
+            'misconception_id': misconception_id,
+        },
+    }
+
+
+class PipelineRunner:
+    """
+    생성 worker pool과 검증 worker pool을 bounded queue로 연결해
+    N번째 행을 검증하는 동안 N+1번째 행을 생성하도록 하는 runner.
+
+    - max_in_flight: 동시에 처리 중인 행의 최대 수. 두 queue의 크기도 이 값으로 맞춰
+      재생성(검증 → 생성 queue로 되돌림) 시에도 queue가 가득 차 멈추지 않도록 함
+    - 결과는 입력 순서대로 yield
+    """
+
+    def __init__(
+        self,
+        predictor,
+        generator,
+        checker,
+        generation_workers: int = 2,
+        verification_workers: int = 1,
+        max_in_flight: int = 8,
+        max_retries: int = 5,
+        num_inferences: int = 10,
+        check_options: Optional[dict] = None,
+    ):
+        self.predictor = predictor
+        self.generator = generator
+        self.checker = checker
+        self.generation_workers = max(1, generation_workers)
+        self.verification_workers = max(1, verification_workers)
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max_retries
+        self.num_inferences = num_inferences
+        # checker.check_answer에 추가로 넘길 인자 (예: SelfConsistencyChecker의 adaptive, round_size, confidence_threshold)
+        self.check_options = dict(check_options or {})
+
+    def _finish_task(self, stage: str, step, task, next_queue, done_queue, in_flight):
+        """
+        step(task, next_queue)을 실행. step이 True를 반환하거나 예외가 나면 그 행은 끝난 것이므로
+        결과를 done_queue에 넣고 in-flight 자리를 반납 (어떤 경우에도 수집 루프가 결과를 기다리며 멈추지 않도록)
+        """
+        result = task['result']
+        finished = True
+        try:
+            finished = step(task, next_queue)
+        except Exception as e:
+            logger.error(f"[Row {result.index}] {stage} failed: {e}")
+            result.status, result.error = "failed", str(e)
+        finally:
+            if finished:
+                done_queue.put(result)
+                in_flight.release()
+
+    def _generate(self, task, verification_queue) -> bool:
+        result = task['result']
+        # Module2 호출: 유사 문항 생성 (검증 불일치 후 재생성이면 응답 캐시를 건너뛰어 다른 문제를 받음)
+        if result.mismatch_count:
+            gen_question, _ = self.generator.generate_similar_question_with_text(**task['generation_input'], refresh=True)
+        else:
+            gen_question, _ = self.generator.generate_similar_question_with_text(**task['generation_input'])
+        if not gen_question:
+            result.status = "no_question"
+            return True
+        task['question'] = gen_question
+        verification_queue.put(task)
+        return False
+
+    def _verify(self, task, generation_queue) -> bool:
+        result = task['result']
+        gen_question = task['question']
+        result.question = gen_question
+        # Module3: num_inferences번 추론 → 다수결 결과
+        predicted_answer, explanation = self.checker.check_answer(
+            question=gen_question.question,
+            choices=gen_question.choices,
+            num_inferences=self.num_inferences,
+            **self.check_options
+        )
+
+        # gold answer가 "A) ..." 처럼 되어 있으면, "A" 부분만 떼어 비교
+        gold_answer_letter = gen_question.correct_answer.split(")")[0].strip()
+        # checker가 답을 고르지 못하면 None을 줄 수 있으므로 빈 문자열로 맞춤 (불일치로 처리)
+        predicted_answer = (predicted_answer or "").strip()
+        result.predicted_answer = predicted_answer
+        result.explanation = explanation
+        result.attempts.append({'question': gen_question, 'predicted_answer': predicted_answer})
+
+        if predicted_answer and predicted_answer.upper() == gold_answer_letter.upper():
+            result.status = "accepted"
+            return True
+
+        result.mismatch_count += 1
+        if result.mismatch_count >= self.max_retries:
+            result.status = "rejected"
+            return True
+        # 정답 불일치 → 재생성
+        generation_queue.put(task)
+        return False
+
+    def _generation_worker(self, generation_queue, verification_queue, done_queue, in_flight):
+        while True:
+            task = generation_queue.get()
+            if task is _STOP:
+                return
+            self._finish_task("generation", self._generate, task, verification_queue, done_queue, in_flight)
+
+    def _verification_worker(self, generation_queue, verification_queue, done_queue, in_flight):
+        while True:
+            task = verification_queue.get()
+            if task is _STOP:
+                return
+            self._finish_task("verification", self._verify, task, generation_queue, done_queue, in_flight)
+
+    def run(self, rows) -> Iterator[PipelineResult]:
+        """
+        rows: (row_id, row) 쌍의 iterable (예: df.iterrows())
+        처리가 끝난 결과를 입력 순서대로 yield
+        """
+        generation_queue = queue.Queue(maxsize=self.max_in_flight)
+        verification_queue = queue.Queue(maxsize=self.max_in_flight)
+        done_queue = queue.Queue()
+        in_flight = threading.Semaphore(self.max_in_flight)
+        fed = {'count': 0, 'finished': False}
+
+        def feed():
+            try:
+                for index, (row_id, row) in enumerate(rows):
+                    in_flight.acquire()
+                    try:
+                        task = build_task(index, row_id, row, self.predictor)
+                    except Exception as e:
+                        logger.error(f"[Row {index}] misconception prediction failed: {e}")
+                        result = PipelineResult(index, row_id, -1, "", status="failed", error=str(e))
+                        done_queue.put(result)
+                        in_flight.release()
+                    else:
+                        generation_queue.put(task)
+                    fed['count'] = index + 1
+            finally:
+                fed['finished'] = True
+                done_queue.put(None)  # 수집 루프를 깨워 종료 조건을 확인하게 함
+
+        workers = [
+            threading.Thread(target=self._generation_worker, args=(generation_queue, verification_queue, done_queue, in_flight), daemon=True)
+            for _ in range(self.generation_workers)
+        ] + [
+            threading.Thread(target=self._verification_worker, args=(generation_queue, verification_queue, done_queue, in_flight), daemon=True)
+            for _ in range(self.verification_workers)
+        ]
+        feeder = threading.Thread(target=feed, daemon=True)
+        for thread in workers:
+            thread.start()
+        feeder.start()
+
+        pending = {}
+        next_index = 0
+        try:
+            while not (fed['finished'] and next_index >= fed['count']):
+                result = done_queue.get()
+                if result is None:
+                    continue
+                pending[result.index] = result
+                # 순서대로 내보낼 수 있는 결과만 yield
+                while next_index in pending:
+                    yield pending.pop(next_index)
+                    next_index += 1
+        finally:
+            # 소비자가 중간에 멈춘 경우 queue가 차 있을 수 있으므로 막히지 않게 종료 신호 전달
+            # (전달하지 못한 worker는 daemon thread라 프로세스 종료 시 함께 정리됨)
+            for q, count in ((generation_queue, self.generation_workers), (verification_queue, self.verification_workers)):
+                for _ in range(count):
+                    try:
+                        q.put_nowait(_STOP)
+                    except queue.Full:
+                        break
@@ -0,0 +1,195 @@
+# question_bank.py
+# train.csv / test.csv 형식의 문제 데이터를 columnar 캐시(Feather, pyarrow 필요)로 한 번만 변환해 빠르게 로드하고,
+# 세션 간에 공유하는 읽기 전용 문제 은행(QuestionBank) 제공
+import argparse
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+OPTIONS = ["A", "B", "C", "D"]
+
+# 반복이 많은 문자열은 category, 결측이 있는 MisconceptionId는 nullable 정수
+QUESTION_BANK_DTYPES = {
+    "SubjectName": "category",
+    "ConstructName": "category",
+    "CorrectAnswer": "category",
+    **{f"Misconception{option}Id": "Int64" for option in OPTIONS},
+}
+
+# 캐시 형식이 바뀌면 올려서 기존 캐시를 무효화
+CACHE_VERSION = 1
+
+
+def _has_pyarrow() -> bool:
+    """Feather(Arrow) 캐시에는 pyarrow가 필요 (requirements.txt). 없으면 캐시 없이 CSV를 직접 읽음"""
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def read_question_csv(csv_path: str) -> pd.DataFrame:
+    """CSV를 직접 파싱 (QUESTION_BANK_DTYPES 중 파일에 있는 열만 적용)"""
+    columns = pd.read_csv(csv_path, nrows=0).columns
+    dtypes = {col: dtype for col, dtype in QUESTION_BANK_DTYPES.items() if col in columns}
+    return pd.read_csv(csv_path, dtype=dtypes)
+
+
+def _cache_path(csv_path: str, cache_dir: str, signature: str) -> str:
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(cache_dir, f"{stem}.v{CACHE_VERSION}.{signature}.feather")
+
+
+def _remove_stale(cache_dir: str, csv_path: str, keep: str):
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith(f"{stem}.v") and path != keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _write_cache(df: pd.DataFrame, path: str):
+    # 임시 파일에 쓰고 교체해서, 다른 프로세스가 쓰다 만 캐시를 읽지 않도록 함
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    df.to_feather(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _load_question_bank(abs_path: str, signature: str, cache_dir: str) -> pd.DataFrame:
+    if not _has_pyarrow():
+        logger.warning("pyarrow is not installed; reading the question bank CSV without a cache")
+        return read_question_csv(abs_path)
+
+    path = _cache_path(abs_path, cache_dir, signature)
+    if os.path.exists(path):
+        try:
+            df = pd.read_feather(path)
+            logger.info(f"Question bank loaded from cache {path}")
+            return df
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable question bank cache {path}: {e}")
+
+    df = read_question_csv(abs_path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        _write_cache(df, path)
+        _remove_stale(cache_dir, abs_path, keep=path)
+        logger.info(f"Question bank cache written to {path}")
+    except OSError as e:
+        # 읽기 전용 디렉터리 등에서는 캐시 없이 CSV 결과를 그대로 사용
+        logger.warning(f"Could not write question bank cache {path}: {e}")
+    return df
+
+
+# (CSV 경로, 캐시 폴더) → (signature, DataFrame). CSV가 바뀌면 이전 DataFrame을 교체해 메모리에 하나만 둠
+_loaded: Dict[Tuple[str, str], Tuple[str, pd.DataFrame]] = {}
+_loaded_lock = threading.Lock()
+
+
+def load_question_bank(csv_path: str, cache_dir: Optional[str] = None) -> pd.DataFrame:
+    """
+    프로세스 내에서 공유되는 문제 DataFrame을 반환 (수정하지 말고 필요하면 copy해서 사용).
+
+    처음 한 번은 CSV를 파싱해 cache_dir(기본: CSV 옆 .cache/)에 저장하고,
+    이후에는 캐시 파일을 읽습니다. CSV의 크기나 수정 시각이 바뀌면 캐시를 다시 만듭니다.
+    """
+    abs_path = os.path.abspath(csv_path)
+    stat = os.stat(abs_path)
+    signature = f"{stat.st_size}-{stat.st_mtime_ns}"
+    cache_dir = os.path.abspath(cache_dir or os.path.join(os.path.dirname(abs_path), ".cache"))
+    with _loaded_lock:
+        loaded = _loaded.get((abs_path, cache_dir))
+        if loaded is not None and loaded[0] == signature:
+            return loaded[1]
+        df = _load_question_bank(abs_path, signature, cache_dir)
+        _loaded[(abs_path, cache_dir)] = (signature, df)
+        return df
+
+
+class QuestionBank:
+    """
+    여러 세션이 공유하는 읽기 전용 문제 은행.
+
+    세션에는 행 번호(0..len-1)와 선택한 보기만 저장하고, 문제 내용은 필요할 때 row()로 꺼내 씁니다.
+    과목(SubjectName)/개념(ConstructName)별 행 번호 배열을 미리 만들어 두어 범위를 좁힌 샘플링도 바로 할 수 있습니다.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.subject_index = self._group_index("SubjectName")
+        self.construct_index = self._group_index("ConstructName")
+
+    def _group_index(self, column: str) -> Dict[str, np.ndarray]:
+        if column not in self.df.columns:
+            return {}
+        positions = np.arange(len(self.df), dtype=np.int32)
+        groups = pd.Series(positions).groupby(self.df[column].to_numpy(), sort=True)
+        return {str(name): group.to_numpy() for name, group in groups}
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    def sample(
+        self,
+        n: int,
+        subject: Optional[str] = None,
+        construct: Optional[str] = None,
+        rng: Optional[np.random.Generator] = None
+    ) -> np.ndarray:
+        """
+        행 번호 n개를 중복 없이 무작위로 뽑음 (후보가 n개보다 적으면 전부).
+        subject/construct를 주면 해당 과목/개념의 문제에서만 뽑습니다. 시드는 고정하지 않습니다.
+        """
+        rng = rng or np.random.default_rng()
+        if construct is not None:
+            pool = self.construct_index.get(construct, np.empty(0, dtype=np.int32))
+        elif subject is not None:
+            pool = self.subject_index.get(subject, np.empty(0, dtype=np.int32))
+        else:
+            pool = None
+        size = len(self) if pool is None else len(pool)
+        picks = rng.choice(size, size=min(n, size), replace=False).astype(np.int32)
+        return picks if pool is None else pool[picks]
+
+    def row(self, position: int) -> dict:
+        """행 번호의 문제를 {열 이름: 값} dict로 반환"""
+        return self.df.iloc[int(position)].to_dict()
+
+    def misconception_id(self, position: int, answer: str):
+        """행 번호의 문제에서 보기 answer에 해당하는 MisconceptionId (없으면 pd.NA / NaN)"""
+        column = f"Misconception{answer}Id"
+        if column not in self.df.columns:
+            return pd.NA
+        return self.df[column].iat[int(position)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="문제 CSV를 columnar 캐시로 변환하고 CSV 파싱과 로드 시간/메모리 비교")
+    parser.add_argument("csv_path", nargs="?", default="Data/train.csv")
+    parser.add_argument("--cache-dir", default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    raw = pd.read_csv(args.csv_path)
+    csv_seconds = time.perf_counter() - start
+
+    load_question_bank(args.csv_path, args.cache_dir)  # 캐시가 없으면 생성
+    _loaded.clear()
+    start = time.perf_counter()
+    bank = load_question_bank(args.csv_path, args.cache_dir)
+    cache_seconds = time.perf_counter() - start
+
+    print(f"format: {'feather' if _has_pyarrow() else 'none (pyarrow not installed)'}")
+    print(f"pd.read_csv : {csv_seconds * 1000:.1f} ms, {raw.memory_usage(deep=True).sum() / 1e6:.2f} MB")
+    print(f"cache load  : {cache_seconds * 1000:.1f} ms, {bank.memory_usage(deep=True).sum() / 1e6:.2f} MB")
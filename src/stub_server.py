@@ -0,0 +1,177 @@
+# stub_server.py
+# HF Inference API 형식을 흉내 내는 오프라인 stub 서버 (결정적인 유사 문제/정답 응답, 지연 시간·오류율 설정 가능)
+# 실행: python -m src.stub_server --port 8089 --latency 0.5 --error-rate 0.05
+#       LLM_BACKEND=stub python -m src.main ...   (또는 streamlit run app.py)
+import argparse
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+OPTIONS = ["A", "B", "C", "D"]
+STUB_QUESTION_PATTERN = re.compile(r"What is (\d+) × (\d+)\?")
+
+
+def _prompt_seed(prompt: str) -> int:
+    return int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16], 16)
+
+
+def canned_question(prompt: str) -> str:
+    """프롬프트마다 항상 같은, 형식에 맞는 곱셈 객관식 문제 (보기 순서와 정답 위치도 프롬프트로 결정)"""
+    rng = random.Random(_prompt_seed(prompt))
+    a, b = rng.randint(3, 12), rng.randint(3, 12)
+    correct = a * b
+    values = [correct, correct + a, correct - b, a + b]
+    # 보기 값이 겹치지 않도록 조정
+    for i in range(1, len(values)):
+        while values[i] in values[:i]:
+            values[i] += 1
+    rng.shuffle(values)
+    answer = OPTIONS[values.index(correct)]
+    return (
+        "---\n"
+        f"Question: What is {a} × {b}?\n"
+        + "".join(f"{option}) {value}\n" for option, value in zip(OPTIONS, values))
+        + f"Correct Answer: {answer}\n"
+        f"Explanation: {a} × {b} = {correct}, so the answer is {answer}.\n"
+        "---"
+    )
+
+
+def verification_answer(prompt: str) -> Optional[str]:
+    """검증 프롬프트(문제 + 보기)에 stub 문제가 있으면 정답 보기 문자를 계산"""
+    match = STUB_QUESTION_PATTERN.search(prompt)
+    if match is None:
+        return None
+    correct = str(int(match.group(1)) * int(match.group(2)))
+    for option in OPTIONS:
+        choice = re.search(rf"^\s*{option}\)\s*(.+?)\s*$", prompt, flags=re.MULTILINE)
+        if choice and choice.group(1) == correct:
+            return option
+    return None
+
+
+def stub_response(prompt: str) -> str:
+    """프롬프트 종류에 따라 생성 문제 / 정답 문자 / 기본 응답을 반환"""
+    if "Question: <Your Question Text>" in prompt:
+        return canned_question(prompt)
+    if all(f"{option})" in prompt for option in OPTIONS):
+        return verification_answer(prompt) or "A"
+    return "This is a stub response."
+
+
+class StubBehavior:
+    """
+    요청마다 지연(latency + 토큰당 token_delay)과 오류(503, estimated_time 포함)를 결정.
+    오류 발생 여부는 seed로 고정된 난수열을 요청 순서대로 사용하므로 같은 부하에서는 재현 가능합니다.
+    """
+
+    def __init__(self, latency: float = 0.0, token_delay: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def next_is_error(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            is_error = self._rng.random() < self.error_rate
+            self.errors += is_error
+            return is_error
+
+
+def _make_handler(behavior: StubBehavior):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+        def _send_json(self, status: int, body):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            prompt = str(request.get("inputs", ""))
+            params = request.get("parameters") or {}
+
+            time.sleep(behavior.latency)
+            if behavior.next_is_error():
+                self._send_json(503, {"error": "Stub server overloaded", "estimated_time": 0.1})
+                return
+
+            text = stub_response(prompt)
+            if request.get("stream"):
+                self._stream(text)
+                return
+            if params.get("return_full_text", True):
+                text = prompt + text
+            self._send_json(200, [{"generated_text": text}])
+
+        def _stream(self, text: str):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            # 단어(공백 포함) 단위로 토큰을 흉내 냄
+            tokens = re.findall(r"\S+\s*|\s+", text)
+            try:
+                for index, token in enumerate(tokens):
+                    time.sleep(behavior.token_delay)
+                    event = {"index": index, "token": {"id": index, "text": token, "special": False}, "generated_text": None}
+                    self.wfile.write(f"data:{json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                done = {"index": len(tokens), "token": {"id": -1, "text": "", "special": True}, "generated_text": text}
+                self.wfile.write(f"data:{json.dumps(done, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # 클라이언트가 필요한 필드를 다 받고 연결을 끊은 경우
+                pass
+
+    return StubHandler
+
+
+def start_stub_server(host: str = "127.0.0.1", port: int = 0, behavior: Optional[StubBehavior] = None) -> Tuple[ThreadingHTTPServer, str]:
+    """백그라운드 스레드에서 stub 서버를 시작하고 (server, URL) 반환 (port=0이면 빈 포트 자동 선택)"""
+    server = ThreadingHTTPServer((host, port), _make_handler(behavior or StubBehavior()))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://{host}:{server.server_port}/"
+    logger.info(f"Stub LLM server listening on {url}")
+    return server, url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="오프라인 부하 테스트용 HF Inference API stub 서버")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="요청당 응답 전 지연 (초)")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="스트리밍 시 토큰당 지연 (초)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="503 응답 비율 (0~1)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    behavior = StubBehavior(args.latency, args.token_delay, args.error_rate, args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), _make_handler(behavior))
+    logger.info(f"Stub LLM server listening on http://{args.host}:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info(f"Stopped after {behavior.requests} requests ({behavior.errors} errors)")